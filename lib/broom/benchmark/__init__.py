@@ -0,0 +1,7 @@
+"""Benchmarks for the graph engine.
+
+Each module exposes a main() so it can be run with broomrun, e.g.,
+
+    broomrun broom.benchmark.memory
+
+"""
@@ -0,0 +1,110 @@
+"""Synthetic dependency graphs for benchmarking the engine.
+
+Each generator takes a size, n, and returns a Dag of about n Cells.
+A cell's Value is the sum of its inputs' Values plus one (modulo a
+prime, so that values stay small) or, for a cell without inputs, a
+settable and overlayable value of its own.  Cells are bound the
+way BroomObjects bind their fields, without the database behind
+them, so the graphs can be built anywhere.
+
+"""
+
+import random
+
+from broom.graph.graph import NodeDescriptor, NodeDescriptorBound
+
+__all__ = ['Cell', 'Dag', 'chain', 'fanIn', 'fanOut', 'diamonds', 'randomDag', 'SHAPES']
+
+_PRIME = 1000003
+
+def _source(self):
+    return 1
+
+def _value(self):
+    total = 1
+    for cell in self.inputs:
+        total += cell.Value()
+    return total % _PRIME
+
+_SOURCE = NodeDescriptor(_source, NodeDescriptor.SETTABLE | NodeDescriptor.OVERLAYABLE, 'Value')
+_VALUE = NodeDescriptor(_value, NodeDescriptor.READONLY, 'Value')
+
+class Cell(object):
+
+    def __init__(self, inputs=()):
+        self.inputs = tuple(inputs)
+        self.Value = NodeDescriptorBound(self, _VALUE if self.inputs else _SOURCE)
+
+class Dag(object):
+    """The cells of a graph (which hold the graph's objects alive),
+    its sources -- the cells without inputs -- and its targets, the
+    cells nothing reads.
+
+    """
+    def __init__(self, name, cells):
+        self.name = name
+        self.cells = cells
+        self.sources = [cell for cell in cells if not cell.inputs]
+        read = set()
+        for cell in cells:
+            read.update(id(input) for input in cell.inputs)
+        self.targets = [cell for cell in cells if id(cell) not in read]
+
+    def __len__(self):
+        return len(self.cells)
+
+    @property
+    def depth(self):
+        """The number of cells on the longest path."""
+        depths = {}
+        for cell in self.cells:     # Inputs always come first.
+            depths[id(cell)] = 1 + max([depths[id(input)] for input in cell.inputs] or [0])
+        return max(depths.values())
+
+def chain(n):
+    """n cells, each reading the one before."""
+    cells = [Cell()]
+    for i in range(n - 1):
+        cells.append(Cell([cells[-1]]))
+    return Dag('chain', cells)
+
+def fanIn(n):
+    """n sources, all read by one cell."""
+    sources = [Cell() for i in range(n)]
+    return Dag('fanIn', sources + [Cell(sources)])
+
+def fanOut(n):
+    """One source, read by each of n cells."""
+    source = Cell()
+    return Dag('fanOut', [source] + [Cell([source]) for i in range(n)])
+
+def diamonds(n):
+    """About n cells in diamonds stacked one on another: a cell read
+    by two, both read by a third, which tops the next diamond.  The
+    number of paths from the source doubles with each diamond.
+
+    """
+    cells = [Cell()]
+    for i in range(max(1, (n - 1) // 3)):
+        top = cells[-1]
+        left, right = Cell([top]), Cell([top])
+        cells.extend([left, right, Cell([left, right])])
+    return Dag('diamonds', cells)
+
+def randomDag(n, degree=3, window=100, sources=None, seed=0):
+    """n cells: the first sources of them (a tenth, by default)
+    have no inputs, and each of the rest reads up to degree cells
+    chosen at random from the window before it.
+
+    """
+    rng = random.Random(seed)
+    if sources is None:
+        sources = max(1, n // 10)
+    cells = [Cell() for i in range(min(n, sources))]
+    for i in range(len(cells), n):
+        start = max(0, i - window)
+        count = min(degree, i - start)
+        cells.append(Cell(rng.sample(cells[start:i], count)))
+    return Dag('random', cells)
+
+SHAPES = (chain, fanIn, fanOut, diamonds, randomDag)
@@ -0,0 +1,195 @@
+"""Times the graph engine over synthetic graphs (see dags), as JSON.
+
+For each shape and size, on a fresh graph, times:
+
+    cold        reading every target for the first time
+    warm        reading them all again
+    set         setting a source (the invalidation it causes)
+    recompute   reading every target after that
+    batch       setting every source in a batch, then reading
+    scenario    entering a scenario, setting a what-if on the source
+                and reading every target (per scenario)
+    nested      the same in each of a stack of nested scenarios
+                (per level)
+    sweep       Graph.sweep of one target over what-if values of
+                its source (per value)
+
+all in seconds, the best of repeat runs.  Graphs deeper than 100
+cells are evaluated with maxDepth set, as they would otherwise
+exceed the recursion limit.
+
+    broomrun broom.benchmark.engine [sizes [repeat [output]]]
+    broomrun broom.benchmark.engine compare old.json new.json [threshold]
+
+The first writes the results to output (or prints them); the second
+prints each timing of new against old and returns 1 if any is more
+than threshold (default 1.2) times slower.
+
+"""
+
+import gc
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import broom.graph.graph as graph
+
+from . import dags
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+OPERATIONS = ('cold', 'warm', 'set', 'recompute', 'batch', 'scenario', 'nested', 'sweep')
+
+def _sourceOf(cell):
+    while cell.inputs:
+        cell = cell.inputs[0]
+    return cell
+
+def _read(fields):
+    for field in fields:
+        field()
+
+def measure(dag, scenarios=10, nesting=10, sweepValues=20):
+    """Returns the timings of a single run over dag, keyed by
+    operation.
+
+    """
+    graph._graph = g = graph.Graph(**({'maxDepth': 100} if dag.depth > 100 else {}))
+    targets = [cell.Value for cell in dag.targets]
+    source = _sourceOf(dag.targets[0]).Value
+    sources = [cell.Value for cell in dag.sources]
+    times = {}
+    gc.collect()
+
+    start = _timer()
+    _read(targets)
+    times['cold'] = _timer() - start
+
+    start = _timer()
+    _read(targets)
+    times['warm'] = _timer() - start
+
+    start = _timer()
+    source.setValue(2)
+    times['set'] = _timer() - start
+
+    start = _timer()
+    _read(targets)
+    times['recompute'] = _timer() - start
+
+    start = _timer()
+    with graph.batch():
+        for field in sources:
+            field.setValue(3)
+    _read(targets)
+    times['batch'] = _timer() - start
+
+    start = _timer()
+    for i in range(scenarios):
+        with graph.scenario():
+            source.setWhatIf(i)
+            _read(targets)
+    times['scenario'] = (_timer() - start) / scenarios
+
+    stack = []
+    start = _timer()
+    try:
+        for i in range(nesting):
+            s = graph.scenario()
+            s.__enter__()
+            stack.append(s)
+            sources[i % len(sources)].setWhatIf(i)
+            _read(targets)
+    finally:
+        for s in reversed(stack):
+            s.__exit__(None, None, None)
+    times['nested'] = (_timer() - start) / nesting
+
+    start = _timer()
+    g.sweep(targets[0].node(), source.node(), list(range(sweepValues)))
+    times['sweep'] = (_timer() - start) / sweepValues
+    return times
+
+def run(sizes=(100, 1000, 10000), repeat=3, shapes=dags.SHAPES, log=None):
+    """Returns the results for each of shapes at each of sizes."""
+    results = {}
+    savedGraph = graph._graph
+    try:
+        for shape in shapes:
+            for n in sizes:
+                dag = shape(n)
+                if log is not None:
+                    log.write('%s %d\n' % (dag.name, n))
+                best = {}
+                for r in range(repeat):
+                    for op, seconds in measure(dag).items():
+                        best[op] = min(seconds, best.get(op, seconds))
+                results.setdefault(dag.name, {})[str(n)] = {
+                        'cells': len(dag),
+                        'depth': dag.depth,
+                        'times': best,
+                        }
+    finally:
+        graph._graph = savedGraph
+    return results
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.STDOUT).decode('ascii').strip()
+    except Exception:
+        return None
+
+def compare(old, new, threshold=1.2, out=sys.stdout):
+    """Prints the timings of new against old (both as run() gives
+    them).  Returns the number more than threshold times slower.
+
+    """
+    regressions = 0
+    out.write('%-10s %6s %-10s %12s %12s %7s\n' % ('shape', 'size', 'operation', 'old', 'new', 'ratio'))
+    for name in sorted(new):
+        for size in sorted(new[name], key=int):
+            if size not in old.get(name, {}):
+                continue
+            before = old[name][size]['times']
+            after = new[name][size]['times']
+            for op in OPERATIONS:
+                if op not in before or op not in after:
+                    continue
+                ratio = after[op] / before[op] if before[op] else float('inf')
+                slower = ratio > threshold
+                regressions += slower
+                out.write('%-10s %6s %-10s %10.1fus %10.1fus %6.2fx%s\n' % (
+                        name, size, op, before[op] * 1e6, after[op] * 1e6, ratio, ' *' if slower else ''))
+    return regressions
+
+def main(*args):
+    if args and args[0] == 'compare':
+        with open(args[1]) as f:
+            old = json.load(f)['results']
+        with open(args[2]) as f:
+            new = json.load(f)['results']
+        threshold = float(args[3]) if len(args) > 3 else 1.2
+        return 1 if compare(old, new, threshold) else 0
+    sizes = [int(n) for n in (args[0] if args else '100,1000,10000').split(',')]
+    repeat = int(args[1]) if len(args) > 1 else 3
+    report = {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sizes': sizes,
+        'repeat': repeat,
+        'results': run(sizes, repeat, log=sys.stderr),
+        }
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if len(args) > 2:
+        with open(args[2], 'w') as f:
+            f.write(data + '\n')
+    else:
+        print(data)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
@@ -0,0 +1,82 @@
+"""Times binding fields to objects, eagerly against lazily.
+
+BroomObjects used to bind every field when created (in __new__);
+they now bind each the first time it is read (see
+graph.NodeDescriptorBinding).  Stand-in classes with fields fields
+each, bound either way, let this run without a database:
+
+    create      creating an object
+    first       the first read of one field of an object (binding it,
+                if lazy)
+    again       a later read of the same field
+
+all per object, the best of repeat runs over count objects.
+
+    broomrun broom.benchmark.fields [count [fields [repeat]]]
+
+"""
+
+import gc
+import sys
+import time
+
+from broom.graph.graph import NodeDescriptor, NodeDescriptorBinding, NodeDescriptorBound
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+def _value(self):
+    return 1
+
+def classes(fields):
+    """Returns the eager and lazy stand-in classes, each with the
+    given number of fields.
+
+    """
+    names = ['F%d' % i for i in range(fields)]
+
+    class Eager(object):
+        def __new__(cls):
+            obj = super(Eager, cls).__new__(cls)
+            for name in names:
+                object.__setattr__(obj, name, NodeDescriptorBound(obj, getattr(cls, name)))
+            return obj
+
+    class Lazy(object):
+        pass
+
+    for name in names:
+        setattr(Eager, name, NodeDescriptor(_value, NodeDescriptor.READONLY, name))
+        setattr(Lazy, name, NodeDescriptorBinding(_value, NodeDescriptor.READONLY, name))
+    return Eager, Lazy
+
+def measure(cls, count):
+    gc.collect()
+    start = _timer()
+    objs = [cls() for i in range(count)]
+    create = _timer() - start
+    start = _timer()
+    for obj in objs:
+        obj.F0
+    first = _timer() - start
+    start = _timer()
+    for obj in objs:
+        obj.F0
+    again = _timer() - start
+    return create / count, first / count, again / count
+
+def main(count=100000, fields=20, repeat=3):
+    count = int(count)
+    fields = int(fields)
+    repeat = int(repeat)
+    print("%d objects of %d fields" % (count, fields))
+    print("%6s %12s %12s %12s" % ('', 'create', 'first', 'again'))
+    for cls in classes(fields):
+        best = None
+        for r in range(repeat):
+            times = measure(cls, count)
+            best = times if best is None else tuple(min(a, b) for a, b in zip(best, times))
+        print("%6s %10.0fns %10.0fns %10.0fns" % ((cls.__name__,) + tuple(t * 1e9 for t in best)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
@@ -0,0 +1,126 @@
+"""Measures the per-node memory cost of the graph engine.
+
+Builds a large number of nodes, each with one computed NodeData
+and one input edge, and reports the bytes used per node for the
+current slotted representation and for the dict-based layout it
+replaced.
+
+"""
+
+import gc
+import sys
+import time
+
+from broom.graph.graph import Graph, Node, NodeData, NodeDescriptor, NodeDescriptorBound
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+class _DictNode(object):
+    """The node layout prior to slotting, kept for comparison."""
+
+    def __init__(self, graph, key, descriptor, args=(), flags=0):
+        self._graph = graph
+        self._key = key
+        self._descriptor = descriptor
+        self._args = args
+        self._flags = flags
+        self._inputNodes = set()
+        self._outputNodes = set()
+
+class _DictNodeData(object):
+    """The node data layout prior to slotting, kept for comparison."""
+
+    def __init__(self, node, dataStore):
+        self._node = node
+        self._dataStore = dataStore
+        self._flags = 0
+        self._value = None
+
+class _Owner(object):
+    pass
+
+# Nodes hold their owner weakly, so keep it alive here.
+_owner = _Owner()
+
+def _function(obj, i):
+    return i
+
+def _build(count, nodeClass, nodeDataClass):
+    graph = Graph()
+    dataStore = graph.rootDataStore
+    descriptor = NodeDescriptorBound(_owner, NodeDescriptor(_function, name='Value'))
+    previous = None
+    for i in range(count):
+        key = descriptor.key((i,))
+        node = graph._nodesByKey[key] = nodeClass(graph, key, descriptor, (i,))
+        nodeData = dataStore._nodeDataByNodeKey[key] = nodeDataClass(node, dataStore)
+        nodeData._value = i
+        nodeData._flags = NodeData.VALID
+        if previous is not None:
+            if nodeClass is Node:
+                graph.nodeAddDependency(node, previous)
+            else:
+                node._inputNodes.add(previous)
+                previous._outputNodes.add(node)
+        previous = node
+    return graph
+
+def _sizeOf(graph):
+    size = 0
+    dataStore = graph.rootDataStore
+    for key, node in graph._nodesByKey.items():
+        for obj in (node, dataStore._nodeDataByNodeKey[key]):
+            size += sys.getsizeof(obj)
+            if hasattr(obj, '__dict__'):
+                size += sys.getsizeof(obj.__dict__)
+        for edges in (node._inputNodes, node._outputNodes):
+            if isinstance(edges, (list, set)):
+                size += sys.getsizeof(edges)
+    return size
+
+def measure(count, nodeClass, nodeDataClass):
+    """Returns (total bytes per node, object bytes per node,
+    seconds to build) for count nodes of the given classes.
+
+    The total is every byte allocated while building, including
+    the key tuples, values and table entries common to both
+    representations; it is only available where tracemalloc is.
+    The object figure counts only the nodes, node data and edge
+    collections themselves, from sys.getsizeof.
+
+    """
+    gc.collect()
+    if tracemalloc:
+        tracemalloc.start()
+    start = time.time()
+    graph = _build(count, nodeClass, nodeDataClass)
+    elapsed = time.time() - start
+    total = None
+    if tracemalloc:
+        total = float(tracemalloc.get_traced_memory()[0]) / count
+        tracemalloc.stop()
+    objects = float(_sizeOf(graph)) / count
+    del graph
+    gc.collect()
+    return total, objects, elapsed
+
+def main(count=1000000):
+    count = int(count)
+    before = measure(count, _DictNode, _DictNodeData)
+    after = measure(count, Node, NodeData)
+    print("nodes: %d" % count)
+    print("%-18s %12s %12s %8s" % ('', 'total B/node', 'object B/node', 'build s'))
+    for label, (total, objects, elapsed) in (('before (dict)', before),
+                                            ('after (slotted)', after)):
+        print("%-18s %12s %12.1f %8.2f" % (
+                label, '%.1f' % total if total else '-', objects, elapsed))
+    if before[0] and after[0]:
+        print("total reduction:   %.1fx" % (before[0] / after[0]))
+    print("object reduction:  %.1fx" % (before[1] / after[1]))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
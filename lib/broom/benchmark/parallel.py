@@ -0,0 +1,80 @@
+"""Times parallel evaluation of a wide graph.
+
+Builds a node summing width independent leaves, each of which
+reads a common source and then either sleeps (standing in for I/O)
+or spins (CPU-bound work).  After one serial evaluation has
+recorded the edges, the source is changed and the sum recomputed
+serially, on a thread pool and in forked processes.
+
+"""
+
+import multiprocessing
+import sys
+import time
+
+import broom.graph.graph as graph
+from broom.graph.graph import NodeDescriptor, NodeDescriptorBound
+from broom.graph.scheduler import GraphProcessScheduler, GraphScheduler
+
+def _source(obj):
+    return 0
+
+def _sleep(obj, i):
+    time.sleep(obj.cost)
+    return obj.Source() + i
+
+def _spin(obj, i):
+    n = 0
+    end = obj.cost * 3e7     # Roughly cost seconds of work.
+    while n < end:
+        n += 1
+    return obj.Source() + i
+
+def _total(obj):
+    return sum(obj.Leaf(i) for i in range(obj.width))
+
+class _Wide(object):
+
+    def __init__(self, width, leaf, cost):
+        self.width = width
+        self.cost = cost
+        self.Source = NodeDescriptorBound(self, NodeDescriptor(_source, NodeDescriptor.SETTABLE, 'Source'))
+        self.Leaf = NodeDescriptorBound(self, NodeDescriptor(leaf, NodeDescriptor.READONLY, 'Leaf'))
+        self.Total = NodeDescriptorBound(self, NodeDescriptor(_total, NodeDescriptor.READONLY, 'Total'))
+
+def measure(wide, scheduler=None):
+    """Returns the seconds taken to recompute wide.Total() after a
+    change to its source.
+
+    """
+    wide.Source.setValue(wide.Source() + 1)
+    start = time.time()
+    if scheduler is None:
+        value = wide.Total()
+    else:
+        value = scheduler.nodeValue(wide.Total.node())
+    elapsed = time.time() - start
+    assert value == sum(range(wide.width)) + wide.width * wide.Source()
+    return elapsed
+
+def main(width=64, cost=0.01, workers=None):
+    width = int(width)
+    cost = float(cost)
+    workers = int(workers or multiprocessing.cpu_count())
+    print("width: %d  cost: %gs  workers: %d" % (width, cost, workers))
+    print("%-6s %-10s %9s %8s" % ('leaves', 'scheduler', 'seconds', 'speedup'))
+    for name, leaf in (('sleep', _sleep), ('spin', _spin)):
+        graph._graph = graph.Graph()
+        wide = _Wide(width, leaf, cost)
+        wide.Total()
+        serial = measure(wide)
+        print("%-6s %-10s %9.3f %8s" % (name, 'serial', serial, '-'))
+        with GraphScheduler(graph._graph, workers=workers) as scheduler:
+            elapsed = measure(wide, scheduler)
+        print("%-6s %-10s %9.3f %7.1fx" % (name, 'threads', elapsed, serial / elapsed))
+        elapsed = measure(wide, GraphProcessScheduler(graph._graph, workers=workers))
+        print("%-6s %-10s %9.3f %7.1fx" % (name, 'processes', elapsed, serial / elapsed))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
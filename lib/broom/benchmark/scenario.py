@@ -0,0 +1,87 @@
+"""Times reads through nested scenarios.
+
+Computes count values in the root data store, enters depth nested
+scenarios, each with whatIfs what-ifs of its own, and times reading
+the values all back from the innermost one, first by walking the
+chain of parent data stores a level at a time (as data stores used
+to) and then through GraphDataStore.nodeData.  Also times entering
+one more scenario at that depth.
+
+"""
+
+import sys
+import time
+
+import broom.graph.graph as graph
+from broom.graph.graph import NodeDescriptor, NodeDescriptorBound
+
+class _Owner(object):
+    pass
+
+def _value(obj, i):
+    return i
+
+def _input(obj, i):
+    return i
+
+def _walk(dataStore, node):
+    """Looks node data up the way data stores did before they were
+    layered.
+
+    """
+    while dataStore is not None:
+        nodeData = dataStore._nodeDataByNodeKey.get(node.key)
+        if nodeData is not None:
+            return nodeData
+        dataStore = dataStore._activeParentDataStore
+    return None
+
+def measure(depth, count, repeat, whatIfs):
+    graph._graph = g = graph.Graph()
+    owner = _Owner()
+    descriptor = NodeDescriptorBound(owner, NodeDescriptor(_value, NodeDescriptor.READONLY, 'Value'))
+    inputs = NodeDescriptorBound(owner, NodeDescriptor(_input, NodeDescriptor.OVERLAYABLE, 'Input'))
+    nodes = [g.nodeResolve(descriptor, args=(i,)) for i in range(count)]
+    for i in range(count):
+        descriptor(i)
+    scenarios = [graph.scenario() for i in range(depth)]
+    for level, s in enumerate(scenarios):
+        s.__enter__()
+        for i in range(whatIfs):
+            inputs.setWhatIf(-1, level * whatIfs + i)
+    try:
+        dataStore = g.activeDataStore
+        start = time.time()
+        for r in range(repeat):
+            for node in nodes:
+                _walk(dataStore, node)
+        walk = time.time() - start
+        start = time.time()
+        for r in range(repeat):
+            for node in nodes:
+                dataStore.nodeData(node, createIfMissing=False)
+        layered = time.time() - start
+        start = time.time()
+        for r in range(repeat):
+            with graph.scenario():
+                pass
+        enter = time.time() - start
+    finally:
+        for s in reversed(scenarios):
+            s.__exit__(None, None, None)
+    reads = float(count * repeat)
+    return walk / reads, layered / reads, enter / repeat
+
+def main(count=1000, repeat=100, whatIfs=100):
+    count = int(count)
+    repeat = int(repeat)
+    whatIfs = int(whatIfs)
+    print("%d what-ifs per scenario" % whatIfs)
+    print("%5s %12s %12s %12s" % ('depth', 'walk read', 'layered read', 'enter'))
+    for depth in (1, 10, 100):
+        walk, layered, enter = measure(depth, count, repeat, whatIfs)
+        print("%5d %10.0fns %10.0fns %10.1fus" % (depth, walk * 1e9, layered * 1e9, enter * 1e6))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
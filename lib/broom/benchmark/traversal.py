@@ -0,0 +1,67 @@
+"""Times invalidation walks over a wide fan-out.
+
+Builds a single source node with count valid outputs, sets the
+source, and times the resulting nodeInvalidateOutputs walk for
+each adjacency implementation.
+
+"""
+
+import gc
+import sys
+import time
+
+from broom.graph.graph import Graph, GraphAdjacency, GraphArrayAdjacency, NodeData, NodeDescriptor, NodeDescriptorBound
+
+class _Owner(object):
+    pass
+
+# Nodes hold their owner weakly, so keep it alive here.
+_owner = _Owner()
+
+def _function(obj, i):
+    return i
+
+def _build(count, adjacencyClass):
+    graph = Graph(adjacencyClass=adjacencyClass)
+    dataStore = graph.rootDataStore
+    descriptor = NodeDescriptorBound(_owner, NodeDescriptor(_function, NodeDescriptor.SETTABLE, 'Value'))
+    source = graph.nodeResolve(descriptor, args=(-1,))
+    for i in range(count):
+        node = graph.nodeResolve(descriptor, args=(i,))
+        nodeData = dataStore.nodeData(node)
+        nodeData._value = i
+        nodeData._flags = NodeData.VALID
+        graph.nodeAddDependency(node, source)
+    return graph, source
+
+def measure(count, adjacencyClass):
+    """Returns (seconds to build, seconds to invalidate) for a
+    fan-out of count edges.
+
+    """
+    gc.collect()
+    start = time.time()
+    graph, source = _build(count, adjacencyClass)
+    built = time.time() - start
+    gc.disable()
+    try:
+        start = time.time()
+        invalidated = graph.nodeInvalidateOutputs(source)
+        walked = time.time() - start
+    finally:
+        gc.enable()
+    assert len(invalidated) == count
+    return built, walked
+
+def main(count=1000000):
+    count = int(count)
+    print("fan-out edges: %d" % count)
+    print("%-22s %8s %12s %10s" % ('adjacency', 'build s', 'invalidate s', 'ns/edge'))
+    for adjacencyClass in (GraphAdjacency, GraphArrayAdjacency):
+        built, walked = measure(count, adjacencyClass)
+        print("%-22s %8.2f %12.3f %10.1f" % (
+                adjacencyClass.__name__, built, walked, walked * 1e9 / count))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
@@ -1,11 +1,98 @@
+import array
 import collections
 import functools
+import heapq
 import inspect
+import json
+import multiprocessing
+import sys
+import threading
+import time
+import timeit
+import weakref
+
+from .parser import BroomParser
+from .pmap import EMPTY
+
+try:
+    import asyncio
+except ImportError:     # Python 2.
+    asyncio = None
+
+try:
+    import contextvars
+except ImportError:     # Python < 3.7.
+    contextvars = None
+
+# Most nodes have only a handful of inputs and outputs, so a lone
+# edge is stored as the node itself, a few edges as a list, and
+# only larger edge collections as a set.
+_EDGE_LIST_MAX = 8
+
+def _edgeAdd(edges, node):
+    """Adds node to the edge collection, returning the (possibly
+    new) collection.
+
+    """
+    if edges is None:
+        return node
+    if isinstance(edges, Node):
+        if edges is node:
+            return edges
+        return [edges, node]
+    if isinstance(edges, list):
+        if node in edges:
+            return edges
+        if len(edges) < _EDGE_LIST_MAX:
+            edges.append(node)
+            return edges
+        edges = set(edges)
+    edges.add(node)
+    return edges
+
+def _edgeRemove(edges, node):
+    """Removes node from the edge collection, returning the
+    (possibly new) collection.
+
+    """
+    if edges is None:
+        return None
+    if isinstance(edges, Node):
+        return None if edges is node else edges
+    if isinstance(edges, list):
+        if node in edges:
+            edges.remove(node)
+        if len(edges) == 1:
+            return edges[0]
+        return edges or None
+    edges.discard(node)
+    return edges or None
+
+def _edges(edges):
+    """Returns an iterable over an edge collection."""
+    if edges is None:
+        return ()
+    if isinstance(edges, Node):
+        return (edges,)
+    return edges
 
 class CLEAR(object):
     """Sentinel to allow a node to be reset (cleared)."""
 CLEAR = CLEAR()
 
+class NodeNotReady(BaseException):
+    """Raised, with maxDepth set, in place of computing a node that
+    is too deep; see Graph.
+
+    It derives from BaseException so that fields catching Exception
+    let it through.
+
+    """
+    def __init__(self, node, dataStore):
+        super(NodeNotReady, self).__init__(node.name)
+        self.node = node
+        self.dataStore = dataStore
+
 class NodeDescriptor(object):
     # TODO: Get rid of object, do this elsewhere.
 
@@ -14,6 +101,7 @@ class NodeDescriptor(object):
     SETTABLE     = 0x0003                   # 00000011 - Implies OVERLAYABLE.
     SERIALIZABLE = 0x0004                   # 00000100
     STORED       = SETTABLE|SERIALIZABLE    # 00000111 
+    ASYNC        = 0x0008                   # 00001000 - Computed by a coroutine.
 
     def __init__(self, function, flags=0, name=None, delegate=None, **kwargs):
         self._function = function
@@ -55,15 +143,29 @@ class NodeDescriptor(object):
     def stored(self):
         return self.flags & self.STORED == self.STORED
 
+    @property
+    def asynchronous(self):
+        return self.flags & self.ASYNC == self.ASYNC
+
 class NodeDescriptorBound(object):
 
     def __init__(self, obj, descriptor):
-        self._obj = obj
+        # The object is held weakly, and the weak reference used
+        # in node keys, so that the graph alone never keeps an
+        # object alive.  Objects that cannot be weakly referenced
+        # are held (and keyed) directly.
+        try:
+            self._objKey = weakref.ref(obj)
+            self._obj = None
+        except TypeError:
+            self._objKey = self._obj = obj
         self._descriptor = descriptor
 
     @property
     def obj(self):
-        return self._obj
+        if self._obj is not None:
+            return self._obj
+        return self._objKey()
 
     @property
     def descriptor(self):
@@ -85,6 +187,14 @@ class NodeDescriptorBound(object):
     def delegate(self):
         return self.descriptor.delegate
 
+    @property
+    def fingerprint(self):
+        """An optional function reducing the field's value to
+        something cheaper to compare, used for early cutoff.
+
+        """
+        return getattr(self.descriptor, 'fingerprint', None)
+
     def subscribe(self, callback):
         return _graph.nodeSubscribe(self.node(), callback)
 
@@ -116,7 +226,9 @@ class NodeDescriptorBound(object):
         return self.descriptor.function
 
     def key(self, args=()):
-        return (self.obj, self.method) + args
+        if self._obj is None and self._objKey() is None:
+            raise ReferenceError("The object of field %s has been collected." % self.descriptor.name)
+        return (self._objKey, self.method) + args
 
     def node(self, args=()):
         return _graph.nodeResolve(self, args=args)
@@ -124,6 +236,9 @@ class NodeDescriptorBound(object):
     def __call__(self, *args):
         return _graph.nodeValue(self.node(args=args))
 
+    def valueAsync(self, *args):
+        return _graph.nodeValueAsync(self.node(args=args))
+
     def _setData(self, value):
         # TODO: This is a temporary workaround to allow for
         #       initialization of new (or db-read) objects
@@ -145,18 +260,94 @@ class NodeDescriptorBound(object):
     def clearWhatIf(self, *args):
         _graph.nodeClearWhatIf(self.node(args=args))
 
+class NodeDescriptorBinding(NodeDescriptor):
+    """Binds itself to an object the first time it is read from
+    one, and keeps the bound descriptor in the object's __dict__
+    (under its name), where it is found directly from then on.
+    Objects never read from thus never bind anything.
+
+    """
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        return obj.__dict__.setdefault(self.name, self.bind(obj))
+
+    def bind(self, obj):
+        return NodeDescriptorBound(obj, self)
+
+class NodeArgKey(object):
+    """Stands in for an unhashable argument -- a dict, list or set,
+    or a tuple holding one -- in a node key (see _argKey).
+
+    It compares by kind and value, so equal arguments share a node,
+    and keeps its hash, so lookups after the first don't walk the
+    value again.  The node itself keeps the arguments it was first
+    resolved with, which must not be changed afterwards.
+
+    """
+    __slots__ = ('_kind', '_value', '_hash')
+
+    def __init__(self, kind, value):
+        self._kind = kind
+        self._value = value
+        self._hash = hash((kind, value))
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return self is other or isinstance(other, NodeArgKey) \
+                and self._hash == other._hash \
+                and self._kind is other._kind \
+                and self._value == other._value
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<%s key %r>' % (self._kind.__name__, self._value)
+
+def _argKey(arg):
+    """Returns arg if it is hashable, and otherwise a NodeArgKey for
+    it (made of the keys of anything it holds).
+
+    """
+    try:
+        hash(arg)
+        return arg
+    except TypeError:
+        pass
+    if isinstance(arg, dict):
+        return NodeArgKey(dict, frozenset((k, _argKey(v)) for k, v in arg.items()))
+    if isinstance(arg, (set, frozenset)):
+        return NodeArgKey(set, frozenset(arg))
+    if isinstance(arg, list):
+        return NodeArgKey(list, tuple(_argKey(v) for v in arg))
+    if isinstance(arg, tuple):
+        return NodeArgKey(tuple, tuple(_argKey(v) for v in arg))
+    raise TypeError("A node argument of type %s can't be hashed." % type(arg).__name__)
+
 class Node(object):
+    """A node in the dependency graph.
+
+    Nodes are created in very large numbers, so they are slotted,
+    cache their descriptor's flags in a single integer, and only
+    allocate their input and output edges once an edge is actually
+    added (see _edgeAdd).
+
+    """
+    __slots__ = ('_graph', '_key', '_descriptor', '_args', '_flags',
+                 '_id', '_inputNodes', '_outputNodes')
 
-    def __init__(self, graph, key, descriptor, args=(), flags=0):
+    def __init__(self, graph, key, descriptor, args=(), flags=None):
         self._graph = graph
         self._key = key
         self._descriptor = descriptor
         self._args = args
-
-        # TODO: Remove flags, or use descriptor's flags.
-        self._flags = flags
-        self._inputNodes = set()
-        self._outputNodes = set()
+        self._flags = descriptor.flags if flags is None else flags
+        self._id = None
+        self._inputNodes = None
+        self._outputNodes = None
 
     @property
     def graph(self):
@@ -188,19 +379,23 @@ class Node(object):
 
     @property
     def settable(self):
-        return self.descriptor.settable
+        return self._flags & NodeDescriptor.SETTABLE == NodeDescriptor.SETTABLE
 
     @property
     def overlayable(self):
-        return self.descriptor.overlayable
+        return self._flags & NodeDescriptor.OVERLAYABLE == NodeDescriptor.OVERLAYABLE
 
     @property
     def serializable(self):
-        return self.descriptor.serializable
+        return self._flags & NodeDescriptor.SERIALIZABLE == NodeDescriptor.SERIALIZABLE
 
     @property
     def stored(self):
-        return self.descriptor.stored
+        return self._flags & NodeDescriptor.STORED == NodeDescriptor.STORED
+
+    @property
+    def asynchronous(self):
+        return self._flags & NodeDescriptor.ASYNC == NodeDescriptor.ASYNC
 
     @property
     def args(self):
@@ -214,6 +409,22 @@ class Node(object):
     def delegate(self):
         return self.descriptor.delegate
 
+    @property
+    def id(self):
+        """The node's dense integer ID, if the graph's adjacency
+        assigns them; otherwise None.
+
+        """
+        return self._id
+
+    @property
+    def inputs(self):
+        return self._graph.nodeInputs(self)
+
+    @property
+    def outputs(self):
+        return self._graph.nodeOutputs(self)
+
     def valid(self, dataStore=None):
         return self._graph.nodeData(self, dataStore=dataStore).valid
 
@@ -229,11 +440,17 @@ class NodeData(object):
     VALID = 0x0001
     FIXED = 0x0002
 
+    __slots__ = ('_node', '_dataStore', '_flags', '_value', '_inputs',
+                 '_changedAt', '_verifiedAt')
+
     def __init__(self, node, dataStore):
         self._node = node
         self._dataStore = dataStore
         self._flags = self.NONE
         self._value = None
+        self._inputs = None     # Nodes read by the last evaluation.
+        self._changedAt = None  # Graph revision the value last changed at.
+        self._verifiedAt = None # Graph revision the value was last known good at.
 
     @property
     def node(self):
@@ -249,17 +466,33 @@ class NodeData(object):
 
     @property
     def value(self):
-        if not self.valid and not self.fixed:
+        if not self._flags & (self.VALID|self.FIXED):
             raise RuntimeError("This node's value needs to be computed or set.")
         return self._value
 
+    @property
+    def inputs(self):
+        """The nodes read, in order, by the evaluation that produced
+        this data, or an empty tuple if it was never evaluated.
+
+        """
+        return self._inputs or ()
+
+    @property
+    def changedAt(self):
+        return self._changedAt
+
+    @property
+    def verifiedAt(self):
+        return self._verifiedAt
+
     @property
     def valid(self):
-        return bool(self.flags & self.VALID)
+        return bool(self._flags & self.VALID)
 
     @property
     def fixed(self):
-        return bool(self.flags & self.FIXED)
+        return bool(self._flags & self.FIXED)
 
     def _prettyFlags(self):
         if self.flags == self.NONE:
@@ -289,6 +522,7 @@ class NodeSubscription(object):
         self._callback = callback
         self._descriptor = descriptor
         self._args = args
+        self._value = None
 
     @property
     def descriptor(self):
@@ -302,54 +536,830 @@ class NodeSubscription(object):
     def callback(self):
         return self._callback
 
+    @property
+    def value(self):
+        """In a reactive graph, the node's value when last notified
+        (None if reading it raised).
+
+        """
+        return self._value
+
     def notify(self):
         self.callback(self.descriptor, *self._args)
 
+class GraphAdjacency(object):
+    """Keeps a graph's edges as object references on the nodes
+    themselves.
+
+    Subclasses may store edges differently; the graph only ever
+    reaches them through the methods below.  Those that set INDEXED
+    give nodes dense integer IDs (node._id), by which the root data
+    store then also indexes its node data, and provide
+    invalidateOutputs.
+
+    """
+    INDEXED = False
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def nodeAdded(self, node):
+        pass
+
+    def nodeRemoved(self, node):
+        """Removes every edge into and out of node."""
+        for dependency in _edges(node._inputNodes):
+            dependency._outputNodes = _edgeRemove(dependency._outputNodes, node)
+        for output in _edges(node._outputNodes):
+            output._inputNodes = _edgeRemove(output._inputNodes, node)
+        node._inputNodes = node._outputNodes = None
+
+    def edgeAdd(self, node, dependency):
+        node._inputNodes = _edgeAdd(node._inputNodes, dependency)
+        dependency._outputNodes = _edgeAdd(dependency._outputNodes, node)
+
+    def edgeRemove(self, node, dependency):
+        node._inputNodes = _edgeRemove(node._inputNodes, dependency)
+        dependency._outputNodes = _edgeRemove(dependency._outputNodes, node)
+
+    def inputs(self, node):
+        return _edges(node._inputNodes)
+
+    def outputs(self, node):
+        return _edges(node._outputNodes)
+
+    def walkOutputs(self, nodes, visit):
+        """Calls visit once for every node reachable from any of
+        nodes through their outputs.  The walk continues past a
+        node only if visit returns True for it.
+
+        """
+        seen = set()
+        pending = []
+        for node in nodes:
+            pending.extend(_edges(node._outputNodes))
+        while pending:
+            output = pending.pop()
+            if output in seen:
+                continue
+            seen.add(output)
+            if visit(output):
+                pending.extend(_edges(output._outputNodes))
+
+class GraphArrayAdjacency(GraphAdjacency):
+    """Assigns each node a dense integer ID and keeps edges as
+    growable arrays of IDs, so walks touch integers rather than
+    node objects and edges cost four bytes each.
+
+    Invalidation in the root data store never leaves IDs: node data
+    is looked up by ID, and nodes are only resolved for the data
+    actually invalidated.
+
+    """
+    INDEXED = True
+
+    def __init__(self, graph):
+        super(GraphArrayAdjacency, self).__init__(graph)
+        self._nodes = []
+        self._inputIDs = []
+        self._outputIDs = []
+        self._freeIDs = []
+
+    def nodeAdded(self, node):
+        if self._freeIDs:
+            node._id = self._freeIDs.pop()
+            self._nodes[node._id] = node
+            return
+        node._id = len(self._nodes)
+        self._nodes.append(node)
+        self._inputIDs.append(None)
+        self._outputIDs.append(None)
+
+    def nodeRemoved(self, node):
+        nodeID = node._id
+        for dependencyID in self._inputIDs[nodeID] or ():
+            outputIDs = self._outputIDs[dependencyID]
+            outputIDs.remove(nodeID)
+            if not outputIDs:
+                self._outputIDs[dependencyID] = None
+        for outputID in self._outputIDs[nodeID] or ():
+            inputIDs = self._inputIDs[outputID]
+            inputIDs.remove(nodeID)
+            if not inputIDs:
+                self._inputIDs[outputID] = None
+        self._nodes[nodeID] = self._inputIDs[nodeID] = self._outputIDs[nodeID] = None
+        self._freeIDs.append(nodeID)
+        # The node may still be among other nodes' recorded inputs,
+        # and must not be taken for whichever node gets its ID next.
+        node._id = None
+
+    def node(self, nodeID):
+        return self._nodes[nodeID]
+
+    def edgeAdd(self, node, dependency):
+        # The input and output arrays mirror each other, so only
+        # the (usually short) input array needs checking for an
+        # existing edge.
+        inputIDs = self._inputIDs[node._id]
+        if inputIDs is None:
+            self._inputIDs[node._id] = array.array('i', (dependency._id,))
+        elif inputIDs[-1] == dependency._id or dependency._id in inputIDs:
+            return
+        else:
+            inputIDs.append(dependency._id)
+        outputIDs = self._outputIDs[dependency._id]
+        if outputIDs is None:
+            self._outputIDs[dependency._id] = array.array('i', (node._id,))
+        else:
+            outputIDs.append(node._id)
+
+    def edgeRemove(self, node, dependency):
+        if dependency._id is None or self._nodes[dependency._id] is not dependency:
+            return      # Removed, along with its edges.
+        inputIDs = self._inputIDs[node._id]
+        if inputIDs is None or dependency._id not in inputIDs:
+            return
+        inputIDs.remove(dependency._id)
+        self._outputIDs[dependency._id].remove(node._id)
+        if not inputIDs:
+            self._inputIDs[node._id] = None
+        if not self._outputIDs[dependency._id]:
+            self._outputIDs[dependency._id] = None
+
+    def inputs(self, node):
+        nodes = self._nodes
+        return [nodes[i] for i in self._inputIDs[node._id] or ()]
+
+    def outputs(self, node):
+        nodes = self._nodes
+        return [nodes[i] for i in self._outputIDs[node._id] or ()]
+
+    def walkOutputs(self, nodes, visit):
+        outputIDs = self._outputIDs
+        seen = set()
+        pending = array.array('i')
+        for node in nodes:
+            pending.extend(outputIDs[node._id] or ())
+        nodes = self._nodes
+        while pending:
+            nodeID = pending.pop()
+            if nodeID in seen:
+                continue
+            seen.add(nodeID)
+            if visit(nodes[nodeID]):
+                ids = outputIDs[nodeID]
+                if ids is not None:
+                    pending.extend(ids)
+
+    def invalidateOutputs(self, nodes, nodeDataByID, retain=False):
+        """Marks invalid the valid data, in nodeDataByID, of every
+        node reachable from nodes through their outputs, stopping at
+        fixed data, and drops its value unless retain is set.
+        Returns the data invalidated.
+
+        """
+        outputIDs = self._outputIDs
+        count = len(nodeDataByID)
+        VALID = NodeData.VALID
+        FIXED = NodeData.FIXED
+        seen = set()
+        pending = array.array('i')
+        invalidated = []
+        for node in nodes:
+            pending.extend(outputIDs[node._id] or ())
+        while pending:
+            nodeID = pending.pop()
+            if nodeID in seen:
+                continue
+            seen.add(nodeID)
+            nodeData = nodeDataByID[nodeID] if nodeID < count else None
+            if nodeData is not None:
+                flags = nodeData._flags
+                if flags & FIXED:
+                    continue
+                if flags & VALID:
+                    nodeData._flags = flags & ~VALID
+                    if not retain:
+                        nodeData._value = nodeData._verifiedAt = None
+                    invalidated.append(nodeData)
+            ids = outputIDs[nodeID]
+            if ids is not None:
+                pending.extend(ids)
+        return invalidated
+
+class GraphMemoryBudget(object):
+    """Bounds the memory held by computed values in a graph's root
+    data store.
+
+    Each computed value is charged its size (sys.getsizeof by
+    default, or the sizeOf function given) and remembers how long
+    it took to compute.  Whenever the total exceeds the budget,
+    values are evicted -- marked invalid and dropped, keeping
+    their edges -- until it no longer does.
+
+    The victim is chosen GreedyDual-style: a value's priority is
+    the current inflation level plus its compute time per byte,
+    refreshed on every hit, and the inflation level rises to the
+    priority of each value evicted.  Values that are cheap to
+    recompute, large, or long unused therefore go first.
+
+    """
+    def __init__(self, graph, budget, sizeOf=None):
+        self._graph = graph
+        self._budget = budget
+        self._sizeOf = sizeOf or sys.getsizeof
+        self._size = 0
+        self._level = 0.0
+        self._entries = {}      # node key -> [nodeData, size, cost, priority]
+        self._queue = []        # (priority, sequence, node key), lazily pruned
+        self._sequence = 0
+        self._evictions = 0
+
+    @property
+    def budget(self):
+        return self._budget
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def evictions(self):
+        return self._evictions
+
+    def _push(self, key, entry):
+        entry[3] = self._level + entry[2] / max(entry[1], 1)
+        self._sequence += 1
+        heapq.heappush(self._queue, (entry[3], self._sequence, key))
+        if len(self._queue) > 2 * len(self._entries) + 64:
+            self._queue = [(e[3], i, k) for i, (k, e) in enumerate(self._entries.items())]
+            heapq.heapify(self._queue)
+
+    def onCompute(self, nodeData, cost):
+        key = nodeData._node.key
+        self.discard(key)
+        entry = self._entries[key] = [nodeData, self._sizeOf(nodeData._value), cost, 0.0]
+        self._size += entry[1]
+        self._push(key, entry)
+        if self._size > self._budget:
+            self.evict()
+
+    def onHit(self, nodeData):
+        key = nodeData._node.key
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._push(key, entry)
+
+    def discard(self, key):
+        """Stops accounting for the value of the node with key,
+        which has been invalidated, set or removed.
+
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+    def evict(self):
+        """Evicts values until the total size is within budget."""
+        while self._size > self._budget and self._queue:
+            priority, _, key = heapq.heappop(self._queue)
+            entry = self._entries.get(key)
+            if entry is None or entry[3] != priority:
+                continue
+            del self._entries[key]
+            self._size -= entry[1]
+            self._level = priority
+            nodeData = entry[0]
+            nodeData._flags &= ~NodeData.VALID
+            nodeData._value = nodeData._verifiedAt = None
+            self._evictions += 1
+
+class GraphProfiler(object):
+    """Collects evaluation statistics for each field (by type and
+    field name): how often it was read, how often the read was a
+    cache hit and how often it was computed, the time spent
+    computing it -- both in all, and in itself rather than in the
+    fields it read -- and how often it was invalidated.
+
+    A call is a read that is either a hit or a compute, whether it
+    comes from a field or from verifying what one read before, so
+    calls are hits plus computes (including computes that raised).
+    Times are seconds, from timeit.default_timer; the total for a
+    field that (indirectly) reads itself counts the nested computes
+    twice.  Under LAZY invalidation nothing is invalidated as such
+    -- stale values are only found, and recomputed, when read -- so
+    invalidations stays at 0.
+
+    """
+    COLUMNS = ('calls', 'hits', 'computes', 'time', 'selfTime', 'invalidations')
+
+    def __init__(self, graph):
+        self._graph = graph
+        self._entries = {}      # (typename, name) -> [calls, hits, computes, time, selfTime, invalidations]
+        self._children = GraphLocal('profilerChildren')
+
+    def _entry(self, node):
+        key = (node.typename, node.name)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries.setdefault(key, [0, 0, 0, 0.0, 0.0, 0])
+        return entry
+
+    def onCall(self, node):
+        self._entry(node)[0] += 1
+
+    def onHit(self, node):
+        self._entry(node)[1] += 1
+
+    def onInvalidate(self, node):
+        self._entry(node)[5] += 1
+
+    def onComputeBegin(self):
+        """Returns a token to pass to onComputeEnd."""
+        children = [0.0]
+        parent = self._children.get()
+        self._children.set(children)
+        return timeit.default_timer(), children, parent
+
+    def onComputeEnd(self, node, token):
+        start, children, parent = token
+        elapsed = timeit.default_timer() - start
+        self._children.set(parent)
+        if parent is not None:
+            parent[0] += elapsed
+        entry = self._entry(node)
+        entry[2] += 1
+        entry[3] += elapsed
+        entry[4] += elapsed - children[0]
+
+    def reset(self):
+        self._entries = {}
+
+    def stats(self):
+        """Returns the statistics as a dictionary, keyed by
+        'Type.Field', of dictionaries keyed by COLUMNS.
+
+        """
+        return dict(('%s.%s' % key, dict(zip(self.COLUMNS, entry)))
+                    for key, entry in list(self._entries.items()))
+
+    def report(self, top=20, sortBy='selfTime'):
+        """Returns a table of the top fields by sortBy (one of
+        COLUMNS), and by name among equals.
+
+        """
+        stats = self.stats()
+        names = sorted(stats, key=lambda name: (-stats[name][sortBy], name))[:top]
+        lines = ['%-40s %8s %8s %8s %10s %10s %8s' % (('field',) + self.COLUMNS)]
+        for name in names:
+            s = stats[name]
+            lines.append('%-40s %8d %8d %8d %10.4f %10.4f %8d' % (
+                    name, s['calls'], s['hits'], s['computes'],
+                    s['time'], s['selfTime'], s['invalidations']))
+        return '\n'.join(lines)
+
+    def dump(self):
+        """Returns the statistics as JSON."""
+        return json.dumps(self.stats(), sort_keys=True)
+
+class GraphDispatcher(object):
+    """Delivers subscription notifications apart from the changes
+    that cause them.
+
+    Notified subscriptions are queued, each at most once however
+    often its node is invalidated before it is delivered, and
+    delivered by flush().  With background set, a thread flushes
+    the queue whenever it has waited debounce seconds since the
+    first of a run of notifications; otherwise the queue waits for
+    flush() to be called (from an event loop, say).
+
+    A callback that raises is reported to onError, called with its
+    sys.exc_info(), and delivery goes on with the rest.  Without an
+    onError, the background thread reports it with sys.excepthook,
+    while flush() leaves the rest queued and raises.
+
+    """
+    def __init__(self, graph, debounce=0.0, background=True, onError=None):
+        self._graph = graph
+        self._debounce = debounce
+        self._onError = onError
+        self._condition = threading.Condition()
+        self._pending = collections.OrderedDict()
+        self._delivering = 0
+        self._delivered = 0
+        self._closed = False
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._run, name='GraphDispatcher')
+            self._thread.daemon = True
+            self._thread.start()
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    @property
+    def delivered(self):
+        return self._delivered
+
+    def dispatch(self, subscriptions):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The dispatcher is closed.")
+            for subscription in subscriptions:
+                self._pending[subscription] = None
+            self._condition.notify_all()
+
+    def flush(self):
+        """Delivers the queued notifications in the calling thread.
+        Returns how many were delivered.
+
+        """
+        with self._condition:
+            pending = list(self._pending)
+            self._pending = collections.OrderedDict()
+            self._delivering += 1
+        onError = self._onError
+        if onError is None and self._thread is not None:
+            onError = _reportError
+        delivered = 0
+        try:
+            for i, subscription in enumerate(pending):
+                try:
+                    subscription.notify()
+                except Exception:
+                    if onError is None:
+                        self._requeue(pending[i + 1:])
+                        raise
+                    onError(sys.exc_info())
+                    continue
+                delivered += 1
+                self._delivered += 1
+        finally:
+            with self._condition:
+                self._delivering -= 1
+                self._condition.notify_all()
+        return delivered
+
+    def _requeue(self, subscriptions):
+        with self._condition:
+            pending = collections.OrderedDict((subscription, None) for subscription in subscriptions)
+            pending.update(self._pending)
+            self._pending = pending
+
+    def wait(self, timeout=None):
+        """Waits until nothing is queued or being delivered.  Returns
+        False if timeout seconds pass first.
+
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._pending or self._delivering:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self):
+        """Delivers what is queued, then stops the dispatcher."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            self.flush()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+            if self._debounce and not self._closed:
+                time.sleep(self._debounce)
+            self.flush()
+
+def _reportError(excInfo):
+    sys.excepthook(*excInfo)
+
+class GraphLocal(object):
+    """A value local to the running thread or, where the contextvars
+    module is available, to the running context (so that each asyncio
+    task, say, sees its own).
+
+    """
+    __slots__ = ('get', 'set')
+
+    def __init__(self, name, default=None):
+        if contextvars is not None:
+            var = contextvars.ContextVar(name, default=default)
+            self.get = var.get
+            self.set = var.set
+            return
+        local = threading.local()
+        def get():
+            return getattr(local, 'value', default)
+        def set(value):
+            local.value = value
+        self.get = get
+        self.set = set
+
 class GraphState(object):
     """Collects run-time state for a graph.
 
+    What is being evaluated, in which data stores, and any open batch
+    is held in GraphLocals, so that each thread evaluates in its own
+    context; subscriptions are shared.
+
     """
     def __init__(self, graph):
         self._graph = graph
-        self._activeParentNode = None
-        self._activeDataStoreStack = None
-        self._subscriptionsByNodeKey = collections.defaultdict(lambda: set())
+        self._activeParentNode = GraphLocal('activeParentNode')
+        self._activeInputs = GraphLocal('activeInputs')
+        self._activeDataStoreStack = GraphLocal('activeDataStoreStack', (graph._rootDataStore,))
+        self._activeBatch = GraphLocal('activeBatch')
+        self._activeDepth = GraphLocal('activeDepth', 0)
+        self._subscriptionsByNodeKey = {}
 
 class Graph(object):
+    """The dependency graph.
+
+    Every change to a fixed value advances the graph's revision, and
+    node data records the revision its value last changed at and the
+    revision it was last known to be good at.
+
+    With EAGER invalidation (the default) a change immediately walks
+    and invalidates everything downstream of it.  With LAZY
+    invalidation a change in the root data store only advances the
+    revision; a valid value is instead checked when it is read, by
+    bringing each input it read up to date and looking for one that
+    changed after the value was last verified.  A change is then
+    O(1), and only the part of the graph that is read again pays for
+    it.  Changes within scenarios are always invalidated eagerly.
+
+    A graph may be used from several threads at once.  Each thread
+    has its own evaluation context (see GraphState); the graph's
+    tables and edges change only under its lock, and a node being
+    computed by one thread is waited for, rather than computed again,
+    by any other that needs it.  A value computed while a write
+    happened elsewhere is returned but not kept as valid.
+
+    Asynchronous nodes, whose functions are coroutine functions, are
+    read with nodeValueAsync, which computes them as tasks on the
+    running asyncio event loop; see there.
+
+    With earlyCutoff, a recomputed value that equals the one it
+    replaces (or whose field's fingerprint function gives an equal
+    result) keeps its old changedAt revision.  Invalidated nodes
+    also keep their old values, so when one is next read it first
+    checks its inputs: if none of them actually changed it becomes
+    valid again ("green") without being recomputed, and only nodes
+    with a changed input ("red") are recomputed.
+
+    Within a batch (see batch()) values are still set immediately,
+    but invalidation is put off until the next read or the end of
+    the batch and then done in a single walk, and subscriptions are
+    notified, each at most once, when the outermost batch exits.
+    Batches belong to the thread that opened them.
+
+    Evaluation normally recurses, one level for every level of the
+    dependency chain.  With maxDepth set it never nests computes (or
+    verifications) more than maxDepth deep: a node that would need
+    computing any deeper raises NodeNotReady instead, which unwinds
+    to the outermost read; that node is then evaluated from there,
+    and the field that needed it run again.  Chains of any length
+    thus evaluate within the recursion limit, at the cost of partly
+    re-running about one field in maxDepth.  Fields must let
+    NodeNotReady through, and not depend on running only once.
+
+    With reactive set, subscriptions are not just told that their
+    nodes went invalid.  After each change (or batch of them) every
+    subscribed node that was invalidated is first read again, in the
+    data store the change was made in -- which computes each of
+    their inputs once, inputs before the nodes that read them --
+    and only once all are current are the subscriptions notified,
+    each with its node's new value (see NodeSubscription.value).
+    A subscriber therefore never sees some nodes updated and others
+    not.
 
-    def __init__(self, dataStoreClass=None, stateClass=None):
+    """
+    EAGER = 0
+    LAZY  = 1
+
+    def __init__(self, dataStoreClass=None, stateClass=None, adjacencyClass=None,
+                 invalidation=EAGER, earlyCutoff=False, maxDepth=None, reactive=False):
+        self._invalidation = invalidation
+        self._reactive = reactive
+        self._earlyCutoff = earlyCutoff
+        self._maxDepth = maxDepth
+        self._revision = 0
+        self._layerGeneration = 0
+        self._edgesPruned = 0
+        self._whatIfClearedAt = -1
+        self._dataStores = weakref.WeakSet()
         self._dataStoreClass = dataStoreClass or GraphDataStore
         self._rootDataStore = self._dataStoreClass(self)
         self._nodesByKey = {}
+        self._nodeKeysByObjectID = {}
+        self._collectedObjects = []
+        self._nodesReclaimed = 0
+        self._memoryBudget = None
+        self._profiler = None
+        self._snapshot = None
+        self._dispatcher = None
+        self._lock = threading.RLock()
+        self._computing = {}
+        self._computingAsync = {}
+        self._adjacencyClass = adjacencyClass or GraphAdjacency
+        self._adjacency = self._adjacencyClass(self)
+        if self._adjacency.INDEXED:
+            self._rootDataStore._nodeDataByID = []
         self._stateClass = stateClass or GraphState
         self._state = self._stateClass(self)
-        self._state._activeDataStoreStack = [self._rootDataStore]
 
     @property
     def computing(self):
-        return self._state._activeParentNode is not None
+        return self._state._activeParentNode.get() is not None
 
     @property
     def activeDataStore(self):
-        return self._state._activeDataStoreStack[-1]
+        return self._state._activeDataStoreStack.get()[-1]
 
     @property
     def activeDataStores(self):
-        return self._state._activeDataStoreStack
+        return self._state._activeDataStoreStack.get()
 
     @property
     def rootDataStore(self):
-        return self._state._activeDataStoreStack[0]
+        return self._rootDataStore
 
     def activeDataStorePush(self, dataStore):
-        parentDataStore = self.activeDataStore
-        self._state._activeDataStoreStack.append(dataStore)
-        return parentDataStore
+        stack = self._state._activeDataStoreStack.get()
+        self._state._activeDataStoreStack.set(stack + (dataStore,))
+        return stack[-1]
 
     def activeDataStorePop(self):
-        if self.activeDataStore == self.rootDataStore:
+        stack = self._state._activeDataStoreStack.get()
+        if len(stack) == 1:
             raise RuntimeError("You cannot exit the root data store.")
-        return self._state._activeDataStoreStack.pop()
+        self._state._activeDataStoreStack.set(stack[:-1])
+        return stack[-1]
+
+    @property
+    def batching(self):
+        return self._state._activeBatch.get() is not None
+
+    def batch(self):
+        """Returns a context manager that groups the changes made
+        within it into a single invalidation pass.  Batches nest;
+        only the outermost one triggers the pass.
+
+        """
+        return GraphBatch(self)
+
+    def batchBegin(self, batch=None):
+        activeBatch = self._state._activeBatch.get()
+        if activeBatch is None:
+            activeBatch = batch or GraphBatch(self)
+            self._state._activeBatch.set(activeBatch)
+        activeBatch._depth += 1
+
+    def batchEnd(self):
+        batch = self._state._activeBatch.get()
+        if batch is None:
+            raise RuntimeError("You cannot end a batch that hasn't begun.")
+        batch._depth -= 1
+        if batch._depth:
+            return
+        self._state._activeBatch.set(None)
+        self._batchFlush(batch)
+        notified, batch._notified = batch._notified, []
+        self._nodesNotify(notified)
+
+    @property
+    def invalidation(self):
+        return self._invalidation
+
+    @property
+    def revision(self):
+        return self._revision
+
+    @property
+    def earlyCutoff(self):
+        return self._earlyCutoff
+
+    @property
+    def maxDepth(self):
+        return self._maxDepth
+
+    @property
+    def reactive(self):
+        return self._reactive
+
+    @property
+    def memoryBudget(self):
+        return self._memoryBudget
+
+    def setMemoryBudget(self, budget, sizeOf=None):
+        """Bounds the memory used by computed values in the root
+        data store to budget bytes, evicting values as needed (see
+        GraphMemoryBudget).  A budget of None removes the bound.
+
+        """
+        if budget is None:
+            self._memoryBudget = None
+            return
+        self._memoryBudget = GraphMemoryBudget(self, budget, sizeOf=sizeOf)
+
+    @property
+    def profiler(self):
+        return self._profiler
+
+    def setProfiling(self, enabled=True):
+        """Starts profiling evaluation with a new GraphProfiler, or
+        stops it.  Returns the profiler, which can still be reported
+        on once stopped.
+
+        """
+        profiler = self._profiler
+        self._profiler = GraphProfiler(self) if enabled else None
+        return self._profiler or profiler
+
+    def checkpoint(self):
+        """Returns a GraphCheckpoint of the values set in the root
+        data store, to go back to with rollback().
+
+        The root data store keeps its set values in a PersistentMap
+        as well, so a checkpoint is just the map as it stands: taking
+        one is O(1), and checkpoints share whatever they have in
+        common.
+
+        """
+        return GraphCheckpoint(self, self._rootDataStore._fixed)
+
+    def rollback(self, checkpoint):
+        """Sets and clears values in the root data store until those
+        set are the ones set at checkpoint, then invalidates what
+        depends on the nodes changed, in one pass as a batch would.
+        Only what changed since the checkpoint is looked at.
+
+        Values given to objects as they were created are kept, even
+        if the objects were created after the checkpoint; nodes
+        reclaimed since are left alone.
+
+        """
+        if checkpoint.graph is not self:
+            raise RuntimeError("You cannot roll back to another graph's checkpoint.")
+        if self.computing:
+            raise RuntimeError("You cannot modify the graph while it is updating its state.")
+        dataStore = self._rootDataStore
+        fixed = checkpoint._fixed
+        with self._lock:
+            with self.batch():
+                for key, current, saved in list(dataStore._fixed.diff(fixed)):
+                    node = self._nodesByKey.get(key)
+                    if node is None:
+                        if saved is not None:
+                            fixed = fixed.discard(key)
+                        continue
+                    if saved is None and current[1]:
+                        saved = (current[1][0], current[1])
+                        fixed = fixed.set(key, saved)
+                    if saved is not None:
+                        self._nodeFix(node, saved[0], dataStore)
+                    else:
+                        self._nodeUnfix(node, dataStore)
+                dataStore._fixed = fixed
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def setSnapshot(self, snapshot):
+        """Has values in the root data store restored from snapshot
+        (a GraphSnapshot), where it holds a value that is still good,
+        rather than computed.  A snapshot of None stops this.
+
+        """
+        self._snapshot = snapshot
+
+    @property
+    def dispatcher(self):
+        return self._dispatcher
+
+    def setDispatcher(self, dispatcher):
+        """Has subscriptions notified through dispatcher (a
+        GraphDispatcher) instead of as the changes that notify them
+        are made.  A dispatcher of None restores that.  Returns the
+        dispatcher replaced, which is left to the caller to close.
+
+        """
+        previous = self._dispatcher
+        self._dispatcher = dispatcher
+        return previous
 
     def nodeKey(self, descriptor, args=()):
         """Returns a key for the node given computation details.
@@ -368,10 +1378,20 @@ class Graph(object):
         a new node is created and added to the graph.
 
         """
+        if self._collectedObjects:
+            self.nodesReclaim()
         key = self.nodeKey(descriptor, args=args)
-        node = self._nodesByKey.get(key)
+        try:
+            node = self._nodesByKey.get(key)
+        except TypeError:
+            # Unhashable arguments, so key them by value instead.
+            key = self.nodeKey(descriptor, args=tuple(_argKey(arg) for arg in args))
+            node = self._nodesByKey.get(key)
         if not node and createIfMissing:
-            node = self.nodeCreate(key, descriptor, args=args)
+            with self._lock:
+                node = self._nodesByKey.get(key)
+                if not node:
+                    node = self.nodeCreate(key, descriptor, args=args)
         return node
 
     def nodeCreate(self, key, descriptor, args=()):
@@ -383,18 +1403,168 @@ class Graph(object):
         Returns the new node.
 
         """
-        if key in self._nodesByKey:
-            raise RuntimeError("A node with that key value already exists in this graph.")
-        node = self._nodesByKey[key] = Node(self, key, descriptor, args=args)
+        with self._lock:
+            if key in self._nodesByKey:
+                raise RuntimeError("A node with that key value already exists in this graph.")
+            if self._collectedObjects:
+                self.nodesReclaim()
+            obj = None
+            if isinstance(key[0], weakref.ref):
+                obj = key[0]()
+                if obj is None:
+                    raise ReferenceError("The object of field %s has been collected." % descriptor.name)
+            node = Node(self, key, descriptor, args=args)
+            self._adjacency.nodeAdded(node)
+            if obj is not None:
+                self._nodeKeyTrack(obj, key)
+            self._nodesByKey[key] = node
         return node
 
+    def _nodeKeyTrack(self, obj, key):
+        """Records key against obj so the node can be reclaimed
+        once obj is collected.
+
+        Entries are indexed by id(obj); an id can only be reused
+        once the object is dead, by which time its entry has been
+        queued for reclamation, and reclamation always runs before
+        new entries are added.
+
+        """
+        objectID = id(obj)
+        entry = self._nodeKeysByObjectID.get(objectID)
+        if entry is None:
+            collected = self._collectedObjects
+            def onCollected(ref, objectID=objectID):
+                collected.append((objectID, ref))
+            entry = self._nodeKeysByObjectID[objectID] = (weakref.ref(obj, onCollected), [])
+        entry[1].append(key)
+
+    def nodesReclaim(self):
+        """Removes the nodes of every collected object from the
+        graph, along with their edges, data and subscriptions.
+
+        This runs automatically whenever nodes are resolved, so it
+        need only be called directly to release memory promptly.
+
+        Returns the number of nodes reclaimed.
+
+        """
+        reclaimed = 0
+        with self._lock:
+            while self._collectedObjects:
+                objectID, ref = self._collectedObjects.pop()
+                entry = self._nodeKeysByObjectID.get(objectID)
+                if entry is None or entry[0] is not ref:
+                    continue
+                del self._nodeKeysByObjectID[objectID]
+                for key in entry[1]:
+                    node = self._nodesByKey.pop(key, None)
+                    if node is None:
+                        continue
+                    for dataStore in list(self._dataStores):
+                        dataStore._nodeDataRemove(key)
+                    self._adjacency.nodeRemoved(node)
+                    self._state._subscriptionsByNodeKey.pop(key, None)
+                    if self._memoryBudget is not None:
+                        self._memoryBudget.discard(key)
+                    reclaimed += 1
+            self._nodesReclaimed += reclaimed
+        return reclaimed
+
+    def stats(self):
+        """Returns a dictionary of graph size statistics."""
+        self.nodesReclaim()
+        return {
+            'nodes': len(self._nodesByKey),
+            'nodesReclaimed': self._nodesReclaimed,
+            'dataStores': len(self._dataStores),
+            'nodeData': sum(len(d._nodeDataByNodeKey) for d in list(self._dataStores)),
+            'evictions': self._memoryBudget.evictions if self._memoryBudget else 0,
+            }
+
     def nodeAddDependency(self, node, dependency):
         """Adds the dependency as an input to the node, and the node
         as an output of the dependency.
 
         """
-        node._inputNodes.add(dependency)
-        dependency._outputNodes.add(node)
+        with self._lock:
+            self._adjacency.edgeAdd(node, dependency)
+
+    def nodeRemoveDependency(self, node, dependency):
+        """Removes the dependency as an input to the node, and
+        the node as an output of the dependency.
+
+        """
+        with self._lock:
+            self._adjacency.edgeRemove(node, dependency)
+
+    def nodeInputs(self, node):
+        return self._adjacency.inputs(node)
+
+    def nodeOutputs(self, node):
+        return self._adjacency.outputs(node)
+
+    def nodeStaticInputs(self, node, conditional=True):
+        """Returns the nodes node is known, from its method's source,
+        to read on its own object (see BroomParser), leaving out those
+        read only on some paths unless conditional is set.  Returns
+        None if the source can't be analysed.
+
+        These are only what can be known without running the method;
+        edges recorded by evaluating it are always what counts.
+
+        """
+        obj = node.obj
+        if obj is None:
+            return None
+        dependencies = _staticDependencies(obj.__class__, node.descriptor.descriptor)
+        if dependencies is None:
+            return None
+        nodes = []
+        for input in dependencies.inputs:
+            if input.conditional and not conditional:
+                continue
+            args = input.bind(node.args)
+            field = getattr(obj, input.name, None)
+            if args is None or not isinstance(field, NodeDescriptorBound):
+                continue
+            nodes.append(self.nodeResolve(field, args=args))
+        return nodes
+
+    def nodeBuildEdges(self, node):
+        """Adds edges from node, and transitively from its inputs, to
+        every input they are statically known to read (see
+        nodeStaticInputs), so that walks over outputs (invalidation,
+        Scenario.diff, Graph.sweep) reach nodes that have yet to be
+        evaluated.  Nodes already evaluated in the root data store are
+        left to their recorded edges.
+
+        Edges only ever added this way are kept, which can only make
+        invalidation more conservative.  Returns the number of nodes
+        given edges.
+
+        """
+        dataStore = self._rootDataStore
+        built = 0
+        seen = set([node])
+        pending = [node]
+        while pending:
+            node = pending.pop()
+            nodeData = dataStore.nodeData(node, createIfMissing=False)
+            if nodeData is not None and nodeData._inputs is not None:
+                continue
+            inputs = self.nodeStaticInputs(node)
+            if not inputs:
+                continue
+            with self._lock:
+                for dependency in inputs:
+                    self._adjacency.edgeAdd(node, dependency)
+            built += 1
+            for dependency in inputs:
+                if dependency not in seen:
+                    seen.add(dependency)
+                    pending.append(dependency)
+        return built
 
     # 
     # The functions below work on node data.
@@ -417,25 +1587,453 @@ class Graph(object):
         """
         dataStore = dataStore or self.activeDataStore
 
-        if self._state._activeParentNode:
-            self.nodeAddDependency(self._state._activeParentNode, node)
+        state = self._state
+        batch = state._activeBatch.get()
+        if batch is not None and batch._changes:
+            self._batchFlush(batch)
+        inputs = state._activeInputs.get()
+        if inputs is not None:
+            inputs.append(node)
+
+        if self._maxDepth is not None and not state._activeDepth.get():
+            return self._nodeEvaluateIteratively(node, dataStore, computeInvalid)[1]
+        return self._nodeEvaluate(node, dataStore, computeInvalid)[1]
+
+    def _nodeEvaluateIteratively(self, node, dataStore, computeInvalid=True):
+        """Evaluates node from a work stack, evaluating each node
+        that turns out to be too deep first and then trying again
+        (see maxDepth).
 
-        nodeData = self.nodeData(node, dataStore=dataStore, createIfMissing=False)
-        if nodeData and nodeData.valid:
-            return nodeData.value
+        """
+        pending = [(node, dataStore)]
+        pendingKeys = set([(node.key, dataStore)])
+        while True:
+            node, dataStore = pending[-1]
+            try:
+                result = self._nodeEvaluate(node, dataStore, computeInvalid or len(pending) > 1)
+            except NodeNotReady as e:
+                key = (e.node.key, e.dataStore)
+                if key in pendingKeys:
+                    raise RuntimeError("%s depends on itself." % e.node.name)
+                pendingKeys.add(key)
+                pending.append((e.node, e.dataStore))
+                continue
+            pending.pop()
+            if not pending:
+                return result
+            pendingKeys.discard((node.key, dataStore))
+
+    def _nodeEvaluate(self, node, dataStore, computeInvalid=True):
+        """Brings the node up to date as seen from dataStore, without
+        recording it as an input of the active node.
+
+        Returns the node data that now holds its value, along with
+        the value itself (which the data may not keep, if it is
+        evicted straight away).
+
+        """
+        nodeData = dataStore.nodeData(node, createIfMissing=False)
+        maxDepth = self._maxDepth
+        deep = maxDepth is not None and self._state._activeDepth.get() >= maxDepth
+        if nodeData is not None and self._nodeCurrent(nodeData, dataStore, verify=not deep):
+            if self._profiler is not None:
+                self._profiler.onCall(node)
+                self._profiler.onHit(node)
+            return nodeData, nodeData._value
         if not computeInvalid:
             raise RuntimeError("Node is invalid and computeInvalid is False.")
+        if deep:
+            raise NodeNotReady(node, dataStore)
+
+        if nodeData is None or nodeData._dataStore is not dataStore:
+            nodeData = dataStore.nodeData(node, searchParent=False)
+        claim = self._nodeComputeClaim(nodeData)
+        if claim is not None:
+            claim.wait()        # Another thread is computing it.
+            return self._nodeEvaluate(node, dataStore, computeInvalid)
+        if self._profiler is not None:
+            self._profiler.onCall(node)
+        try:
+            if node._flags & NodeDescriptor.ASYNC:
+                return nodeData, self._nodeRunAsync(node, nodeData, dataStore)
+            return self._nodeCompute(node, nodeData, dataStore)
+        finally:
+            self._nodeComputeRelease(nodeData)
+
+    def _nodeCurrent(self, nodeData, dataStore, verify=True):
+        """Returns True if the value in nodeData is up to date as
+        seen from dataStore, verifying it against its inputs if need
+        be (and verify is set).
 
-        if not nodeData or nodeData.dataStore != dataStore:
-            nodeData = self.nodeData(node, dataStore=dataStore, searchParent=False)
+        """
+        if nodeData._flags & NodeData.VALID:
+            if self._invalidation == self.EAGER:
+                # Valid data is current unless its data store was
+                # away while the graph changed (see Scenario).
+                verifyBefore = nodeData._dataStore._verifyBefore
+                current = verifyBefore is None \
+                        or nodeData._flags & NodeData.FIXED \
+                        or nodeData._verifiedAt is not None and nodeData._verifiedAt >= verifyBefore \
+                        or verify and self._nodeVerify(nodeData, dataStore)
+            else:
+                current = nodeData._flags & NodeData.FIXED \
+                        or nodeData._verifiedAt == self._revision \
+                        or verify and self._nodeVerify(nodeData, dataStore)
+        else:
+            current = verify and self._earlyCutoff \
+                    and nodeData._verifiedAt is not None \
+                    and nodeData._dataStore is dataStore \
+                    and self._nodeVerify(nodeData, dataStore)
+            if current:
+                with self._lock:
+                    # Only if nothing was written while verifying.
+                    current = nodeData._verifiedAt == self._revision
+                    if current:
+                        nodeData._flags |= NodeData.VALID
+        if current:
+            budget = self._memoryBudget
+            if budget is not None and nodeData._dataStore is self._rootDataStore:
+                with self._lock:
+                    budget.onHit(nodeData)
+        return current
+
+    def _nodeComputeClaim(self, nodeData):
+        """Claims nodeData for computation by the running thread.
+
+        Returns None if the claim succeeded (or the thread already
+        holds it), and otherwise an event that is set once the
+        thread holding the claim is done.
+
+        """
+        current = threading.current_thread()
+        with self._lock:
+            claim = self._computing.get(nodeData)
+            if claim is None:
+                self._computing[nodeData] = [current, None, 1]
+                return None
+            if claim[0] is current:
+                claim[2] += 1
+                return None
+            if claim[1] is None:
+                claim[1] = threading.Event()
+            return claim[1]
+
+    def _nodeComputeRelease(self, nodeData):
+        with self._lock:
+            claim = self._computing[nodeData]
+            claim[2] -= 1
+            if claim[2]:
+                return
+            del self._computing[nodeData]
+        if claim[1] is not None:
+            claim[1].set()
+
+    def _nodeCompute(self, node, nodeData, dataStore):
+        budget = self._memoryBudget
+        if budget is not None and dataStore is self._rootDataStore:
+            start = timeit.default_timer()
+        else:
+            budget = None
+        profiler = self._profiler
+        if profiler is not None:
+            token = profiler.onComputeBegin()
+        state = self._state
+        revision = self._revision
+        inputs = []
+        completed = False
+        savedParentNode = state._activeParentNode.get()
+        savedInputs = state._activeInputs.get()
+        if self._maxDepth is not None:
+            depth = state._activeDepth.get()
+            state._activeDepth.set(depth + 1)
         try:
-            savedParentNode = self._state._activeParentNode
-            self._state._activeParentNode = node
-            nodeData._value = node.method(node.obj, *node.args)
-            nodeData._flags |= nodeData.VALID
+            state._activeParentNode.set(node)
+            state._activeInputs.set(inputs)
+            if self._snapshot is not None and dataStore is self._rootDataStore:
+                restored, value = self._snapshot.restore(node)
+                if not restored:
+                    del inputs[:]
+                    value = node.method(node.obj, *node.args)
+            else:
+                value = node.method(node.obj, *node.args)
+            completed = True
         finally:
-            self._state._activeParentNode = savedParentNode
-        return nodeData.value
+            state._activeParentNode.set(savedParentNode)
+            state._activeInputs.set(savedInputs)
+            if self._maxDepth is not None:
+                state._activeDepth.set(depth)
+            if profiler is not None:
+                profiler.onComputeEnd(node, token)
+            with self._lock:
+                self._nodeTrackInputs(node, nodeData, inputs, completed)
+                if completed:
+                    self._nodeStore(node, nodeData, value, revision)
+                    if budget is not None:
+                        budget.onCompute(nodeData, timeit.default_timer() - start)
+        return nodeData, value
+
+    def nodeValueAsync(self, node, dataStore=None):
+        """Returns an asyncio future for the value of the given node,
+        computing it if necessary.
+
+        An asynchronous node is computed as a task on the running
+        event loop, in its own copy of the caller's context, so that
+        what it reads -- across awaits, and concurrently with other
+        tasks -- is recorded against it alone.  A node already being
+        computed is not started again; its callers share the one
+        future.  Any other node is evaluated straight away.
+
+        As with nodeValue, the node is recorded as an input of the
+        node being computed, if any.
+
+        """
+        if asyncio is None or contextvars is None:
+            raise RuntimeError("Asynchronous evaluation needs the asyncio and contextvars modules.")
+        dataStore = dataStore or self.activeDataStore
+        state = self._state
+        batch = state._activeBatch.get()
+        if batch is not None and batch._changes:
+            self._batchFlush(batch)
+        inputs = state._activeInputs.get()
+        if inputs is not None:
+            inputs.append(node)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        if not node._flags & NodeDescriptor.ASYNC:
+            if self._maxDepth is not None and not state._activeDepth.get():
+                evaluate = self._nodeEvaluateIteratively
+            else:
+                evaluate = self._nodeEvaluate
+            try:
+                future.set_result(evaluate(node, dataStore)[1])
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        nodeData = dataStore.nodeData(node, createIfMissing=False)
+        if nodeData is not None and self._nodeCurrent(nodeData, dataStore):
+            if self._profiler is not None:
+                self._profiler.onCall(node)
+                self._profiler.onHit(node)
+            future.set_result(nodeData._value)
+            return future
+        if nodeData is None or nodeData._dataStore is not dataStore:
+            nodeData = dataStore.nodeData(node, searchParent=False)
+        with self._lock:
+            pending = self._computingAsync.get(nodeData)
+            if pending is not None:
+                return pending
+            self._computingAsync[nodeData] = future
+        if self._profiler is not None:
+            self._profiler.onCall(node)
+        self._nodeComputeAsync(node, nodeData, dataStore, loop, future)
+        return future
+
+    def _nodeComputeAsync(self, node, nodeData, dataStore, loop, future):
+        """Starts computing an asynchronous node on loop, setting
+        future once done.
+
+        """
+        budget = self._memoryBudget
+        if budget is not None and dataStore is self._rootDataStore:
+            start = timeit.default_timer()
+        else:
+            budget = None
+        profiler = self._profiler
+        state = self._state
+        revision = self._revision
+        inputs = []
+        tokens = []
+        def begin():
+            if profiler is not None:
+                tokens.append(profiler.onComputeBegin())
+            state._activeParentNode.set(node)
+            state._activeInputs.set(inputs)
+            state._activeDepth.set(0)       # A task starts a new stack.
+            return loop.create_task(node.method(node.obj, *node.args))
+        def end(task):
+            if tokens:
+                profiler.onComputeEnd(node, tokens[0])
+            completed = not task.cancelled() and task.exception() is None
+            with self._lock:
+                del self._computingAsync[nodeData]
+                self._nodeTrackInputs(node, nodeData, inputs, completed)
+                if completed:
+                    self._nodeStore(node, nodeData, task.result(), revision)
+                    if budget is not None:
+                        budget.onCompute(nodeData, timeit.default_timer() - start)
+            if task.cancelled():
+                future.cancel()
+            elif completed:
+                future.set_result(task.result())
+            else:
+                future.set_exception(task.exception())
+        try:
+            task = contextvars.copy_context().run(begin)
+        except BaseException:
+            with self._lock:
+                del self._computingAsync[nodeData]
+            raise
+        task.add_done_callback(end)
+
+    def _nodeRunAsync(self, node, nodeData, dataStore):
+        """Computes an asynchronous node for a synchronous reader, on
+        an event loop of its own.
+
+        """
+        if asyncio is None or contextvars is None:
+            raise RuntimeError("Asynchronous evaluation needs the asyncio and contextvars modules.")
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError("%s is asynchronous; use nodeValueAsync within an event loop." % node.name)
+        loop = asyncio.new_event_loop()
+        try:
+            future = loop.create_future()
+            with self._lock:
+                self._computingAsync[nodeData] = future
+            self._nodeComputeAsync(node, nodeData, dataStore, loop, future)
+            return loop.run_until_complete(future)
+        finally:
+            loop.close()
+
+    def _nodeStore(self, node, nodeData, value, revision):
+        """Keeps a value computed from the graph as it stood at
+        revision.
+
+        If anything was written since, the value may mix old and new
+        inputs, so it is not marked valid; it is instead left to be
+        verified or recomputed by the next reader.
+
+        """
+        retained = self._earlyCutoff and nodeData._verifiedAt is not None
+        if not retained or not self._nodeValuesEqual(node, nodeData._value, value):
+            nodeData._changedAt = self._revision
+        nodeData._value = value
+        nodeData._verifiedAt = revision
+        if revision == self._revision:
+            nodeData._flags |= NodeData.VALID
+        else:
+            nodeData._flags &= ~NodeData.VALID
+
+    def _nodeValuesEqual(self, node, previous, value):
+        if previous is value:
+            return True
+        try:
+            fingerprint = node.descriptor.fingerprint
+            if fingerprint is not None:
+                return fingerprint(previous) == fingerprint(value)
+            return bool(previous == value)
+        except Exception:
+            return False        # Incomparable values count as changed.
+
+    def _nodeVerify(self, nodeData, dataStore):
+        """Returns True, and marks the data verified at the current
+        revision, if no input it read has changed since it was last
+        verified.
+
+        Inputs are brought up to date (and so possibly recomputed) in
+        the order they were originally read, stopping at the first
+        that changed, just as re-running the node would.
+
+        """
+        revision = self._revision
+        verifiedAt = nodeData._verifiedAt
+        if verifiedAt is None or nodeData._inputs is None:
+            return False
+        if self._maxDepth is None:
+            return self._nodeVerifyInputs(nodeData, dataStore, revision)
+        local = self._state._activeDepth
+        depth = local.get()
+        local.set(depth + 1)
+        try:
+            return self._nodeVerifyInputs(nodeData, dataStore, revision)
+        finally:
+            local.set(depth)
+
+    def _nodeVerifyInputs(self, nodeData, dataStore, revision):
+        verifiedAt = nodeData._verifiedAt
+        for dependency in nodeData._inputs:
+            if dependency.obj is None:
+                continue        # Collected, so it can no longer change.
+            if dependency._flags & NodeDescriptor.ASYNC:
+                # It can't be brought up to date from here, so is
+                # only good as it stands.
+                dependencyData = dataStore.nodeData(dependency, createIfMissing=False)
+                if dependencyData is None or not self._nodeCurrent(dependencyData, dataStore, verify=False):
+                    return False
+            else:
+                dependencyData = self._nodeEvaluate(dependency, dataStore)[0]
+            if dependencyData._changedAt is None or dependencyData._changedAt > verifiedAt:
+                return False
+            if self._whatIfClearedAt > verifiedAt and dependencyData._dataStore is not dataStore \
+                    and self._whatIfClearedSince(dataStore, dependencyData._dataStore, verifiedAt):
+                return False
+        nodeData._verifiedAt = revision
+        return True
+
+    def _whatIfClearedSince(self, dataStore, bottom, revision):
+        """Returns True if a what-if has been cleared after revision
+        from dataStore or any of its parents above bottom, so that
+        data found in bottom may not be what was read before.
+
+        """
+        while dataStore is not None and dataStore is not bottom:
+            if dataStore._whatIfClearedAt > revision:
+                return True
+            dataStore = dataStore._activeParentDataStore
+        return False
+
+    def _nodeTrackInputs(self, node, nodeData, inputs, completed):
+        """Brings node's input edges in line with the inputs read by
+        an evaluation.
+
+        New inputs always gain an edge.  If the evaluation completed,
+        inputs read by the previous evaluation in the same data store
+        but not by this one lose theirs, unless the node's data in
+        some other data store in use (the root, or an entered
+        scenario) still depends on them; the node's edges are thus
+        the union of what each of its live evaluations read.
+
+        """
+        previous = nodeData._inputs or ()
+        known = set(previous)
+        current = []
+        seen = set()
+        for dependency in inputs:
+            if dependency in seen:
+                continue
+            seen.add(dependency)
+            current.append(dependency)
+            if dependency not in known:
+                self.nodeAddDependency(node, dependency)
+        if not completed:
+            # Keep every edge we know of until an evaluation finishes.
+            current.extend(d for d in previous if d not in seen)
+            nodeData._inputs = tuple(current)
+            return
+        for dependency in previous:
+            if dependency not in seen and not self._nodeInputRetained(node, dependency, nodeData):
+                self.nodeRemoveDependency(node, dependency)
+                self._edgesPruned += 1
+        nodeData._inputs = tuple(current)
+
+    def _nodeInputRetained(self, node, dependency, excluding):
+        # Only data stores in use count: a scenario that has exited
+        # puts back what it needs when re-entered (see
+        # Scenario._restoreEdges).
+        for dataStore in list(self._dataStores):
+            if dataStore._activeParentDataStore is None and dataStore is not self._rootDataStore:
+                continue
+            nodeData = dataStore._nodeDataByNodeKey.get(node.key)
+            if nodeData is not None and nodeData is not excluding \
+                    and nodeData._inputs and dependency in nodeData._inputs:
+                return True
+        return False
 
     # TODO: Rename nodeChanges, and apply changes in usual
     #       set routines.
@@ -447,12 +2045,19 @@ class Graph(object):
 
     def nodeSubscribe(self, node, callback):
         subscription = NodeSubscription(callback, node.descriptor, args=node.args)
-        self._state._subscriptionsByNodeKey[node.key].add(subscription)
+        with self._lock:
+            self._state._subscriptionsByNodeKey.setdefault(node.key, set()).add(subscription)
         return subscription
 
     def nodeUnsubscribe(self, subscription):
         node = self.nodeResolve(subscription.descriptor, subscription.args, createIfMissing=False)
-        self._state._subscriptionsByNodeKey[node.key].discard(subscription)
+        with self._lock:
+            subscriptions = self._state._subscriptionsByNodeKey.get(node.key) if node else None
+            if subscriptions is None:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._state._subscriptionsByNodeKey[node.key]
 
     def _nodeSetData(self, node, value):
         """Sets a value during object initialization.
@@ -467,9 +2072,18 @@ class Graph(object):
         #       data initialization in this way.  Also,
         #       are we truly safe in creating new objects 
         #       in a mutating graph?
+        # Nothing has read the node yet, so the revision stays put;
+        # objects created while computing must not make the value
+        # being computed look stale.
         nodeData = self.nodeData(node, self.rootDataStore)
-        nodeData._value = value
-        nodeData._flags |= (NodeData.FIXED|NodeData.VALID)
+        with self._lock:
+            nodeData._value = value
+            nodeData._flags |= (NodeData.FIXED|NodeData.VALID)
+            nodeData._changedAt = nodeData._verifiedAt = self._revision
+            if self._memoryBudget is not None:
+                self._memoryBudget.discard(node.key)
+            fixed = self._rootDataStore._fixed
+            self._rootDataStore._fixed = fixed.set(node.key, (value, (value,)))
 
     def nodeSetValue(self, node, value, dataStore=None, callDelegate=True):
         if self.computing:
@@ -482,14 +2096,24 @@ class Graph(object):
         if value == CLEAR:
             self.nodeClearValue(node, dataStore=dataStore, callDelegate=callDelegate)
             return
-        dataStore = dataStore or self.activeDataStore
+        self._nodeFix(node, value, dataStore or self.activeDataStore)
+
+    def _nodeFix(self, node, value, dataStore):
         nodeData = self.nodeData(node, dataStore=dataStore, searchParent=False)
         if nodeData.fixed and nodeData.value == value:  # No change.
             return
-        nodeData._value = value
-        nodeData._flags |= (NodeData.FIXED|NodeData.VALID)
-        self.nodeInvalidateOutputs(node, dataStore=dataStore)
-        self.onNodeChanged(node)
+        with self._lock:
+            nodeData._value = value
+            nodeData._flags |= (NodeData.FIXED|NodeData.VALID)
+            self._revision += 1
+            nodeData._changedAt = nodeData._verifiedAt = self._revision
+            if self._memoryBudget is not None:
+                self._memoryBudget.discard(node.key)
+            if dataStore is self._rootDataStore:
+                fixed = dataStore._fixed
+                previous = fixed.get(node.key)
+                dataStore._fixed = fixed.set(node.key, (value, previous[1] if previous else ()))
+        self._nodeChanged(node, dataStore, notify=True)
 
     def nodeClearValue(self, node, dataStore=None, callDelegate=True):
         if self.computing:
@@ -503,10 +2127,13 @@ class Graph(object):
         nodeData = self.nodeData(node, dataStore=dataStore, createIfMissing=False, searchParent=False)
         if not nodeData or not nodeData.fixed:
             raise RuntimeError("You cannot clear a value that hasn't been set.")
-        if node.key in dataStore._nodeDataByNodeKey:
-            del dataStore._nodeDataByNodeKey[node.key]
-        self.nodeInvalidateOutputs(node, dataStore=dataStore)
-        self.onNodeChanged(node)
+        self._nodeUnfix(node, dataStore)
+
+    def _nodeUnfix(self, node, dataStore):
+        with self._lock:
+            dataStore._nodeDataRemove(node.key)
+            self._revision += 1
+        self._nodeChanged(node, dataStore, notify=True)
 
     def nodeSetWhatIf(self, node, value, dataStore=None):
         if self.computing:
@@ -519,9 +2146,12 @@ class Graph(object):
         nodeData = self.nodeData(node, dataStore=dataStore, searchParent=False)
         if nodeData.fixed and nodeData.value == value:  # No change.
             return
-        nodeData._value = value
-        nodeData._flags |= (NodeData.FIXED|NodeData.VALID)
-        self.nodeInvalidateOutputs(node, dataStore=dataStore)
+        with self._lock:
+            nodeData._value = value
+            nodeData._flags |= (NodeData.FIXED|NodeData.VALID)
+            self._revision += 1
+            nodeData._changedAt = nodeData._verifiedAt = self._revision
+        self._nodeChanged(node, dataStore)
 
     def nodeClearWhatIf(self, node, dataStore=None):
         if self.computing:
@@ -534,37 +2164,339 @@ class Graph(object):
         nodeData = self.nodeData(node, dataStore=dataStore, createIfMissing=False, searchParent=False)
         if not nodeData or not nodeData.fixed:
             raise RuntimeError("You cannot clear a value that hasn't been set.")
-        if node.key in dataStore._nodeDataByNodeKey:
-            del dataStore._nodeDataByNodeKey[node.key]
-        self.nodeInvalidateOutputs(node, dataStore=dataStore)
+        with self._lock:
+            dataStore._nodeDataRemove(node.key)
+            self._revision += 1
+            # The node's data now comes from further down, and may
+            # not have changed since what read the what-if was last
+            # verified (see _nodeVerifyInputs).
+            dataStore._whatIfClearedAt = self._whatIfClearedAt = self._revision
+        self._nodeChanged(node, dataStore)
+
+    def sweep(self, target, whatIf, values, workers=None, asArray=False):
+        """Returns the value of target with a what-if of each of
+        values in turn on whatIf, as a list or, if asArray is set, a
+        NumPy array.
+
+        The nodes between whatIf and target are found from the edges
+        recorded by evaluating target (and found again whenever a
+        value takes a branch not taken before), and only they are
+        recomputed for each value; everything else is read from the
+        active data store.  If workers is given, the values are
+        split between that many processes forked from this one (see
+        GraphProcessScheduler), so results must be picklable.
+
+        """
+        if self.computing:
+            raise RuntimeError("You cannot sweep while the graph is updating its state.")
+        if not whatIf.overlayable:
+            raise RuntimeError("This is not an overlayable node.")
+        values = list(values)
+        self.nodeValue(target)
+        if workers is not None and workers > 1 and len(values) > 1:
+            results = self._sweepForked(target, whatIf, values, workers)
+        else:
+            results = self._sweepValues(target, whatIf, values)
+        if asArray:
+            try:
+                import numpy
+            except ImportError:
+                raise RuntimeError("An array of results needs NumPy.")
+            return numpy.asarray(results)
+        return results
+
+    def _sweepValues(self, target, whatIf, values):
+        scenario = Scenario(self)
+        with scenario:
+            # Everything whatIf reaches gets (invalid) data of its own
+            # in the scenario, so none of it is ever read from the
+            # parent, even if an evaluation branches to it.
+            downstream = set()
+            def visit(output):
+                downstream.add(output)
+                return True
+            def reach():
+                self._adjacency.walkOutputs([whatIf], visit)
+                with self._lock:
+                    for node in downstream:
+                        scenario.nodeData(node, searchParent=False)
+            reach()
+            with self._lock:
+                whatIfData = scenario.nodeData(whatIf, searchParent=False)
+                whatIfData._flags |= (NodeData.FIXED|NodeData.VALID)
+                whatIfData._changedAt = whatIfData._verifiedAt = self._revision
+            cone = self._sweepCone(target, downstream, scenario)
+            results = []
+            for value in values:
+                with self._lock:
+                    whatIfData._value = value
+                    for nodeData in cone:
+                        nodeData._flags &= ~NodeData.VALID
+                        nodeData._value = nodeData._verifiedAt = None
+                inputs = [nodeData._inputs for nodeData in cone]
+                results.append(self.nodeValue(target, scenario))
+                if any(nodeData._inputs != previous for nodeData, previous in zip(cone, inputs)):
+                    # A branch taken for the first time may reach
+                    # nodes (computed here) that weren't downstream.
+                    reach()
+                    cone = self._sweepCone(target, downstream, scenario)
+        return results
+
+    def _sweepCone(self, target, downstream, scenario):
+        """Returns the scenario's data for the nodes in downstream
+        that target reads, directly or not.
+
+        """
+        cone = []
+        seen = set()
+        pending = [target]
+        while pending:
+            node = pending.pop()
+            if node in seen or node not in downstream and node is not target:
+                continue
+            seen.add(node)
+            if node in downstream:
+                cone.append(scenario.nodeData(node, searchParent=False))
+            pending.extend(node.inputs)
+        return cone
+
+    def _sweepForked(self, target, whatIf, values, workers):
+        size = -(-len(values) // workers)
+        chunks = [values[i:i + size] for i in range(0, len(values), size)]
+        getContext = getattr(multiprocessing, 'get_context', None)
+        context = getContext('fork') if getContext else multiprocessing
+        work = (self, target, whatIf, self.activeDataStores)
+        pool = context.Pool(len(chunks), _sweepInit, (work,))
+        try:
+            results = pool.map(_sweepChunk, chunks)
+        finally:
+            pool.terminate()
+        return [result for chunk in results for result in chunk]
+
+    def _nodeChanged(self, node, dataStore, notify=False):
+        """Records that the fixed value of node in dataStore has just
+        changed, and invalidates whatever depends on it -- or, within
+        a batch, leaves that for later (see _changesFlush).
+
+        If notify is set, the node's own subscribers are told too.
+
+        """
+        batch = self._state._activeBatch.get()
+        if batch is not None:
+            batch._changes.append((node, dataStore, notify))
+            return
+        self._nodesNotify(self._changesApply([(node, dataStore, notify)]))
+
+    def _batchFlush(self, batch):
+        changes, batch._changes = batch._changes, []
+        batch._notified.extend(self._changesApply(changes))
+
+    def _changesApply(self, changes):
+        """Invalidates the outputs of every changed node, with one
+        walk per data store.
+
+        Returns the nodes whose subscribers should be told, each
+        with the data store it changed in.
+
+        Under LAZY invalidation changes in the root data store are
+        left for readers to discover (see _nodeVerify), and the walk
+        happens only to tell subscribers.
+
+        """
+        dataStores = []
+        nodesByDataStore = {}
+        changed = []
+        for node, dataStore, notify in changes:
+            if dataStore not in nodesByDataStore:
+                dataStores.append(dataStore)
+                nodesByDataStore[dataStore] = []
+            nodesByDataStore[dataStore].append(node)
+            if notify:
+                changed.append((node, dataStore))
+        invalidated = []
+        with self._lock:
+            for dataStore in dataStores:
+                nodes = nodesByDataStore[dataStore]
+                if self._invalidation == self.LAZY and dataStore is self._rootDataStore:
+                    if self._state._subscriptionsByNodeKey:
+                        invalidated.extend((output, dataStore)
+                                           for output in self._nodesNotifiable(nodes, dataStore))
+                    continue
+                invalidated.extend((output, dataStore)
+                                   for output in self._nodesInvalidateOutputs(nodes, dataStore))
+        return invalidated + changed
+
+    def _nodesNotify(self, changes):
+        """Tells the subscribers of each node in changes, a list of
+        (node, data store it changed in) pairs.
+
+        """
+        subscriptionsByNodeKey = self._state._subscriptionsByNodeKey
+        if not subscriptionsByNodeKey:
+            return
+        notified = []
+        nodesBySubscription = {}
+        for change in changes:
+            for subscription in list(subscriptionsByNodeKey.get(change[0].key, ())):
+                if subscription in nodesBySubscription:
+                    continue
+                nodesBySubscription[subscription] = change
+                notified.append(subscription)
+        if not notified:
+            return
+        if self._reactive:
+            self._nodesRecompute(notified, nodesBySubscription)
+        dispatcher = self._dispatcher
+        if dispatcher is not None:
+            dispatcher.dispatch(notified)
+            return
+        for subscription in notified:
+            subscription.notify()
+
+    def _nodesRecompute(self, subscriptions, nodesBySubscription):
+        """Reads the node of each subscription in the data store it
+        changed in, then records the values read on the
+        subscriptions.
+
+        """
+        valuesByNode = {}
+        for subscription in subscriptions:
+            change = nodesBySubscription[subscription]
+            if change in valuesByNode:
+                continue
+            node, dataStore = change
+            try:
+                valuesByNode[change] = self._nodeValueOn(node, self._dataStoreStack(dataStore))
+            except (Exception, NodeNotReady):
+                valuesByNode[change] = None
+        for subscription in subscriptions:
+            subscription._value = valuesByNode[nodesBySubscription[subscription]]
+
+    def _dataStoreStack(self, dataStore):
+        """Returns the stack of active data stores ending at
+        dataStore: the active one, cut short if dataStore is on it,
+        and otherwise its chain of parents.
+
+        """
+        stack = self.activeDataStores
+        if dataStore in stack:
+            return stack[:stack.index(dataStore) + 1]
+        chain = []
+        while dataStore is not None:
+            chain.append(dataStore)
+            dataStore = dataStore._activeParentDataStore
+        if chain[-1] is not self._rootDataStore:
+            chain.append(self._rootDataStore)
+        return tuple(reversed(chain))
+
+    def _nodeValueOn(self, node, stack):
+        """Returns the value of node as seen from the top of stack."""
+        local = self._state._activeDataStoreStack
+        saved = local.get()
+        local.set(stack)
+        try:
+            return self.nodeValue(node, stack[-1])
+        finally:
+            local.set(saved)
+
+    def _nodesNotifiable(self, nodes, dataStore):
+        notified = []
+        def visit(output):
+            outputData = dataStore.nodeData(output, createIfMissing=False)
+            if outputData is None:
+                return True
+            if outputData._flags & NodeData.FIXED:
+                return False
+            if outputData._flags & NodeData.VALID \
+                    and output.key in self._state._subscriptionsByNodeKey:
+                notified.append(output)
+            return True
+        self._adjacency.walkOutputs(nodes, visit)
+        return notified
 
     def nodeInvalidateOutputs(self, node, dataStore=None):
         dataStore = dataStore or self.activeDataStore
-        outputs = list(node._outputNodes)
+        with self._lock:
+            invalidated = self._nodesInvalidateOutputs([node], dataStore)
+        if self._state._subscriptionsByNodeKey:
+            self._nodesNotify([(output, dataStore) for output in invalidated])
+        return invalidated
+
+    def _nodesInvalidateOutputs(self, nodes, dataStore):
+        budget = self._memoryBudget if dataStore is self._rootDataStore else None
+        profiler = self._profiler
+        retain = self._earlyCutoff
+        if dataStore._nodeDataByID is not None:
+            invalidatedData = self._adjacency.invalidateOutputs(nodes, dataStore._nodeDataByID, retain)
+            invalidated = set(nodeData._node for nodeData in invalidatedData)
+            if budget is not None and not retain:
+                for nodeData in invalidatedData:
+                    budget.discard(nodeData._node.key)
+            if profiler is not None:
+                for nodeData in invalidatedData:
+                    profiler.onInvalidate(nodeData._node)
+            return invalidated
         invalidated = set()
-        while outputs:
-            output = outputs.pop()
-            outputData = self.nodeData(output, dataStore=dataStore, createIfMissing=False)
-            if outputData and outputData.fixed:
-                continue
-            if outputData and outputData.dataStore != dataStore:
-                outputData = self.nodeData(output, dataStore=dataStore, searchParent=False)
-            if outputData and outputData.valid:
+        def visit(output):
+            outputData = dataStore.nodeData(output, createIfMissing=False)
+            if outputData is None:
+                return True
+            if outputData._flags & NodeData.FIXED:
+                return False
+            if outputData._dataStore is not dataStore:
+                outputData = dataStore.nodeData(output, searchParent=False)
+            if outputData._flags & NodeData.VALID:
                 outputData._flags &= ~NodeData.VALID
-                del outputData._value
+                if not retain:
+                    outputData._value = outputData._verifiedAt = None
+                    if budget is not None:
+                        budget.discard(output.key)
                 invalidated.add(output)
-            outputs.extend(list(output._outputNodes))
-        for invalid in invalidated:
-            self.onNodeInvalidated(invalid)
+                if profiler is not None:
+                    profiler.onInvalidate(output)
+            return True
+        self._adjacency.walkOutputs(nodes, visit)
         return invalidated
 
     def onNodeChanged(self, node):
-        for subscription in self._state._subscriptionsByNodeKey[node.key]:
-            subscription.notify()
+        self._nodesNotify([(node, self.activeDataStore)])
 
     def onNodeInvalidated(self, node):
-        for subscription in self._state._subscriptionsByNodeKey[node.key]:
-            subscription.notify()
+        self._nodesNotify([(node, self.activeDataStore)])
+
+class GraphCheckpoint(object):
+    """The values set in a graph's root data store at some point;
+    see Graph.checkpoint().
+
+    """
+    def __init__(self, graph, fixed):
+        self._graph = graph
+        self._fixed = fixed     # node key -> (value, (value given at creation,) or ())
+
+    @property
+    def graph(self):
+        return self._graph
+
+    def __len__(self):
+        return len(self._fixed)
+
+class GraphBatch(object):
+    """Defers a graph's invalidation work until the batch exits; see
+    Graph.batch().
+
+    """
+    def __init__(self, graph):
+        self._graph = graph
+        self._depth = 0
+        self._changes = []
+        self._notified = []
+
+    def __enter__(self):
+        self._graph.batchBegin(self)
+        return self
+
+    def __exit__(self, *args):
+        self._graph.batchEnd()
 
 class GraphDataStore(object):
 
@@ -575,7 +2507,29 @@ class GraphDataStore(object):
         GraphDataStore._nextID += 1
         self._graph = graph
         self._nodeDataByNodeKey = {}
+        # The same, as a list by node ID, in the root data store of
+        # a graph whose adjacency is INDEXED.
+        self._nodeDataByID = None
         self._activeParentDataStore = None
+        # While the data store has a parent, the node data of every
+        # data store from it down to (but not including) the bottom
+        # one, flattened into a PersistentMap, so that looking data
+        # up takes two lookups however deeply scenarios are nested.
+        self._layered = None
+        self._layeredGeneration = None
+        self._bottomNodeDataByNodeKey = None
+        self._layeredBase = self._layeredSaved = None
+        self._layeredParents = None
+        self._activeChildren = 0
+        # In the root data store, the values set in it, in a
+        # PersistentMap so that Graph.checkpoint() can keep it.
+        self._fixed = EMPTY
+        # Under EAGER invalidation, data verified before this revision
+        # is verified again before it is used.
+        self._verifyBefore = None
+        # The revision at which a what-if was last cleared from it.
+        self._whatIfClearedAt = -1
+        graph._dataStores.add(self)
 
     @property
     def graph(self):
@@ -589,19 +2543,130 @@ class GraphDataStore(object):
         a new NodeData object in the this data store.
 
         """
-        nodeData = self._nodeDataByNodeKey.get(node.key)
-        if nodeData is None and searchParent:
-            dataStore = self._activeParentDataStore
-            while dataStore:
-                nodeData = dataStore._nodeDataByNodeKey.get(node.key)
-                if nodeData:
-                    break
-                dataStore = dataStore._activeParentDataStore
-        if not nodeData and createIfMissing:
-            nodeData = self._nodeDataByNodeKey[node.key] = NodeData(node, self)
+        key = node.key
+        nodeData = self._nodeDataByNodeKey.get(key)
+        if nodeData is None and searchParent and self._layered is not None:
+            if self._layeredGeneration != self._graph._layerGeneration:
+                self._relayer()
+            # Not in our own data, so only the parents' layers need
+            # searching, if there are any.
+            parents = self._layeredParents
+            nodeData = parents.get(key) if parents is not None else None
+            if nodeData is None:
+                nodeData = self._bottomNodeDataByNodeKey.get(key)
+        if nodeData is None and createIfMissing:
+            nodeData = self._nodeDataAdd(key, NodeData(node, self))
+        return nodeData
+
+    def _nodeDataAdd(self, key, nodeData):
+        # setdefault, so threads racing to create it agree on one.
+        nodeData = self._nodeDataByNodeKey.setdefault(key, nodeData)
+        byID = self._nodeDataByID
+        if byID is not None:
+            nodeID = nodeData._node._id
+            if nodeID >= len(byID):
+                byID.extend([None] * (nodeID + 1 - len(byID)))
+            byID[nodeID] = nodeData
+        if self._layered is not None:
+            with self._graph._lock:
+                self._layered = self._layered.set(key, nodeData)
+                self._layerChanged()
+        else:
+            self._layeredSaved = None
         return nodeData
 
+    def _nodeDataRemove(self, key):
+        nodeData = self._nodeDataByNodeKey.pop(key, None)
+        if self._fixed:
+            self._fixed = self._fixed.discard(key)
+        byID = self._nodeDataByID
+        if nodeData is not None and byID is not None:
+            nodeID = nodeData._node._id
+            if nodeID < len(byID) and byID[nodeID] is nodeData:
+                byID[nodeID] = None
+        if nodeData is not None and self._layered is None:
+            self._layeredSaved = None
+        elif nodeData is not None:
+            with self._graph._lock:
+                self._layered = self._layered.discard(key)
+                parent = self._activeParentDataStore
+                if parent._layered is not None:
+                    shown = parent._layered.get(key)
+                    if shown is not None:
+                        self._layered = self._layered.set(key, shown)
+                self._layerChanged()
+
+    def _layerChanged(self):
+        """Marks the layered data of the data store's active children
+        (and theirs) out of date.
+
+        """
+        if self._activeChildren:
+            graph = self._graph
+            current = self._layeredGeneration == graph._layerGeneration
+            graph._layerGeneration += 1
+            if current:
+                self._layeredGeneration = graph._layerGeneration
+
+    def _layerBegin(self, parent):
+        """Stacks the data store on parent."""
+        with self._graph._lock:
+            self._activeParentDataStore = parent
+            parent._activeChildren += 1
+            self._relayer()
+            self._layeredSaved = None
+
+    def _layerEnd(self):
+        with self._graph._lock:
+            self._activeParentDataStore._activeChildren -= 1
+            self._activeParentDataStore = None
+            # Kept for re-entry on the same parent layers.
+            self._layeredSaved = (self._layeredBase, self._layered)
+            self._layered = self._layeredGeneration = self._bottomNodeDataByNodeKey = None
+            self._layeredParents = None
+
+    def _relayer(self):
+        """Rebuilds the layered data from the parent's, which is
+        O(1) but for the data store's own data (unless it is as it
+        was when the data store was last active).
+
+        """
+        with self._graph._lock:
+            parent = self._activeParentDataStore
+            if parent._layered is None:
+                layered = EMPTY
+                self._bottomNodeDataByNodeKey = parent._nodeDataByNodeKey
+            else:
+                if parent._layeredGeneration != self._graph._layerGeneration:
+                    parent._relayer()
+                layered = parent._layered
+                self._bottomNodeDataByNodeKey = parent._bottomNodeDataByNodeKey
+            saved = self._layeredSaved
+            self._layeredBase = layered
+            self._layeredParents = layered if len(layered) else None
+            if saved is not None and saved[0] is layered:
+                self._layered = saved[1]
+            else:
+                self._layered = layered.update(list(self._nodeDataByNodeKey.items()))
+            self._layeredGeneration = self._graph._layerGeneration
+
 class Scenario(GraphDataStore):
+    """A data store for what-ifs, stacked on the active data store
+    while entered.
+
+    A scenario keeps what it computes between entries.  If it is
+    re-entered on the same data store and the graph has changed
+    since it exited, its values are verified against their inputs
+    (as under LAZY invalidation) before they are used, so only what
+    the changes reach is recomputed.  Entered on another data store,
+    it starts afresh.
+
+    """
+    def __init__(self, graph):
+        super(Scenario, self).__init__(graph)
+        self._exitedAt = None
+        self._exitedFrom = None
+        self._exitedPruned = None
 
     def whatIfs(self):
         return [nodeData for nodeData in self._nodeDataByNodeKey.values() if nodeData.fixed]
@@ -617,30 +2682,188 @@ class Scenario(GraphDataStore):
             dataStore = dataStore._activeParentDataStore
         return whatIfsByNodeKey.values()
 
+    def diff(self, parent=None, fields=None):
+        """Returns a dictionary giving, for every node whose value in
+        the scenario differs from its value in parent, the pair of
+        values (in parent, in the scenario).
+
+        Only the scenario's what-ifs and the nodes their recorded
+        outputs reach can differ, so only they are evaluated (in
+        both data stores); fields, a collection of field names,
+        descriptors or bound fields, narrows them down further.
+
+        The parent is the data store the scenario is entered on, or
+        if it is not active, the active data store (on which it is
+        entered for the diff).
+
+        """
+        graph = self.graph
+        if graph.computing:
+            raise RuntimeError("You cannot diff a scenario while the graph is updating its state.")
+        if self in graph.activeDataStores:
+            return self._diff(parent, fields)
+        with self:
+            return self._diff(parent, fields)
+
+    def _diff(self, parent, fields):
+        graph = self.graph
+        stack = graph.activeDataStores
+        stack = stack[:stack.index(self) + 1]
+        if parent is not None and parent is not stack[-2]:
+            raise RuntimeError("A scenario can only be diffed against the data store it is entered on.")
+        whatIfs = [whatIf.node for whatIf in self.whatIfs()]
+        nodes = list(whatIfs)
+        def visit(output):
+            nodes.append(output)
+            return True
+        graph._adjacency.walkOutputs(whatIfs, visit)
+        if fields is not None:
+            fields = set(fields)
+            nodes = [node for node in nodes if node.name in fields
+                     or node.descriptor in fields or node.descriptor.descriptor in fields]
+        # Edges from the what-ifs recorded since they were applied
+        # may lead to nodes the scenario has no data of its own for,
+        # which would otherwise see the parent's values once they
+        # are computed there.  The values in the scenario come
+        # first, and the what-ifs are applied again afterwards for
+        # whatever computing the parent's values newly reached.
+        self._applyWhatIfs(keep=True)
+        nodes = [node for node in nodes if node.obj is not None]
+        afters = [graph._nodeValueOn(node, stack) for node in nodes]
+        differences = {}
+        try:
+            for node, after in zip(nodes, afters):
+                before = graph._nodeValueOn(node, stack[:-1])
+                if not graph._nodeValuesEqual(node, before, after):
+                    differences[node] = (before, after)
+        finally:
+            self._applyWhatIfs(keep=True)
+        return differences
+
     def cleanup(self):
-        for nodeKey, nodeData in self._nodeDataByNodeKey.items():
+        for nodeKey, nodeData in list(self._nodeDataByNodeKey.items()):
             if nodeData.fixed:
                 continue
-            del self._nodeDataByNodeKey[nodeKey]
+            self._nodeDataRemove(nodeKey)
+
+    def _applyWhatIfs(self, keep=False):
+        """Gives the scenario invalid data of its own for whatever its
+        what-ifs reach, so that nothing is read from its parents
+        instead.  If keep is set, data it already has is left as is.
+
+        """
+        graph = self.graph
+        if not keep:
+            for whatIf in self.whatIfs():
+                graph.nodeInvalidateOutputs(whatIf.node, self)
+            return
+        own = self._nodeDataByNodeKey
+        def visit(output):
+            nodeData = own.get(output.key)
+            if nodeData is None:
+                self.nodeData(output, searchParent=False)
+                return True
+            return not nodeData._flags & NodeData.FIXED
+        with graph._lock:
+            graph._adjacency.walkOutputs([whatIf.node for whatIf in self.whatIfs()], visit)
+
+    def _unshadow(self):
+        """Drops computed data that would now hide a value set on a
+        parent data store.
 
-    def _applyWhatIfs(self):
-        for whatIf in self.whatIfs():
-            self.graph.nodeInvalidateOutputs(whatIf.node, self)
+        """
+        parent = self._activeParentDataStore
+        for nodeKey, nodeData in list(self._nodeDataByNodeKey.items()):
+            if nodeData._flags & NodeData.FIXED:
+                continue
+            parentData = parent.nodeData(nodeData._node, createIfMissing=False)
+            if parentData is not None and parentData._flags & NodeData.FIXED:
+                self._nodeDataRemove(nodeKey)
 
     def __enter__(self):
-        if self in self.graph.activeDataStores:
+        graph = self.graph
+        if self in graph.activeDataStores:
             raise RuntimeError("You cannot reenter an active data store.")
-        self._activeParentDataStore = self.graph.activeDataStorePush(self)
-        self._applyWhatIfs()
+        parent = graph.activeDataStorePush(self)
+        keep = self._exitedAt is not None
+        if keep and self._exitedFrom is not parent:
+            self.cleanup()      # Computed on other data stores.
+            keep = False
+        changed = keep and self._exitedAt != graph.revision
+        if changed:
+            self._verifyBefore = graph.revision
+        self._layerBegin(parent)
+        if changed:
+            self._unshadow()
+        if keep and self._exitedPruned != graph._edgesPruned:
+            self._restoreEdges()
+        self._applyWhatIfs(keep)
         return self
 
     def __exit__(self, *args):
-        self.cleanup()
+        self._exitedFrom = self._activeParentDataStore
         self.graph.activeDataStorePop()
-        self._activeParentDataStore = None
+        self._layerEnd()
+        self._exitedAt = self.graph.revision
+        self._exitedPruned = self.graph._edgesPruned
+
+    def _restoreEdges(self):
+        """Adds back the edges of the scenario's data that were
+        pruned while it was not in use.
+
+        """
+        graph = self.graph
+        nodesByKey = graph._nodesByKey
+        with graph._lock:
+            for nodeData in list(self._nodeDataByNodeKey.values()):
+                node = nodeData._node
+                if not nodeData._inputs or nodesByKey.get(node.key) is not node:
+                    continue
+                for dependency in nodeData._inputs:
+                    if nodesByKey.get(dependency.key) is dependency:
+                        graph.nodeAddDependency(node, dependency)
 
 
+_staticDependenciesByKey = {}
+
+def _staticDependencies(cls, descriptor):
+    """Returns the BroomDependencies of descriptor's method on cls,
+    parsing it the first time.
+
+    """
+    key = (cls, descriptor)
+    try:
+        return _staticDependenciesByKey[key]
+    except KeyError:
+        pass
+    fieldNames = set(k for k in dir(cls) if isinstance(getattr(cls, k, None), NodeDescriptor))
+    return _staticDependenciesByKey.setdefault(key, BroomParser(fieldNames).parse(descriptor.function))
+
 def scenario():
     return Scenario(_graph)
 
+def batch():
+    return _graph.batch()
+
+def sweep(target, whatIf, values, **kwargs):
+    """Sweeps the bound field target over values of the bound field
+    whatIf; see Graph.sweep.
+
+    """
+    return _graph.sweep(target.node(), whatIf.node(), values, **kwargs)
+
+# The work handed to each forked worker by _sweepInit (which the
+# pool runs in the worker, so sweeps in other threads don't see it);
+# see Graph._sweepForked.
+_sweepWork = None
+
+def _sweepInit(work):
+    global _sweepWork
+    _sweepWork = work
+
+def _sweepChunk(values):
+    graph, target, whatIf, stack = _sweepWork
+    graph._state._activeDataStoreStack.set(stack)
+    return graph._sweepValues(target, whatIf, values)
+
 _graph = Graph()        # We need somewhere to start.
@@ -24,6 +24,7 @@ Overlayable  = NodeDescriptor.OVERLAYABLE
 Settable     = NodeDescriptor.SETTABLE
 Serializable = NodeDescriptor.SERIALIZABLE
 Stored       = NodeDescriptor.STORED
+Async        = NodeDescriptor.ASYNC
 
 class BroomTypeBase(object):
     def __init__(cls, name, bases, attrs):
@@ -49,6 +50,7 @@ class BroomTypeBase(object):
                 descriptors.append(v)
         cls._fieldDescriptors = descriptors
         cls._fieldNames = [f.name for f in descriptors]
+        cls._fieldNameSet = frozenset(cls._fieldNames)
         cls._storedFieldNames = [f.name for f in descriptors if f.stored]
 
 class BroomType(BroomTypeBase, sqlalchemy.ext.declarative.api.DeclarativeMeta):
@@ -62,8 +64,14 @@ class BroomType(BroomTypeBase, sqlalchemy.ext.declarative.api.DeclarativeMeta):
                     cls, name, bases, attrs
                     )
 
-class FieldDescriptor(NodeDescriptor):
-    pass
+class FieldDescriptor(NodeDescriptorBinding):
+    """Binds a Field (or StoredField) to an object the first time
+    it is read from it; objects loaded but never read from thus
+    never bind their fields at all.
+
+    """
+    def bind(self, obj):
+        return type(obj)._field(obj, self)
 
 class Field(NodeDescriptorBound):
     pass
@@ -71,7 +79,7 @@ class Field(NodeDescriptorBound):
 class StoredField(Field):
     def __init__(self, *args, **kwargs):
         super(StoredField, self).__init__(*args, **kwargs)
-        self._ref = getattr(self._obj.__class__, self.descriptor.ref)
+        self._ref = getattr(self.obj.__class__, self.descriptor.ref)
         sqlalchemy.event.listen(self._ref, 'set', self.onSet)
         sqlalchemy.event.listen(self._ref, 'append', self.onAppend)
         sqlalchemy.event.listen(self._ref, 'remove', self.onRemove)
@@ -177,19 +185,13 @@ class BroomObjectBase(object):
     def _field(cls, obj, v):
         return (StoredField if v.stored else Field)(obj, v)
 
-    def __new__(cls, *args, **kwargs):
-        obj = super(BroomObjectBase, cls).__new__(cls, *args, **kwargs)
-        for v in obj._fieldDescriptors:
-            super(BroomObjectBase, obj).__setattr__(v.name, cls._field(obj, v))
-        return obj
-
     @sqlalchemy.orm.reconstructor
     def initialize(self):
         self._db = self._sa_instance_state.session._db
 
     def __init__(self, *args, **kwargs):
         for k in kwargs.copy():
-            if k not in self._fieldNames:
+            if k not in self._fieldNameSet:
                 continue
             value = kwargs.pop(k)
             field = getattr(self, k)
@@ -233,7 +235,7 @@ class BroomObjectBase(object):
             self._db._session.add(self)
 
     def __setattr__(self, n, v):
-        if n in self._fieldNames:
+        if n in self._fieldNameSet:
             c = getattr(self, n)
             c.setValue(v)
             return
@@ -347,6 +349,22 @@ class BroomObjectBase(object):
     def stored(cls):
         return hasattr(cls, '__tablename__')
 
+    def snapshotIdentity(self):
+        """Returns the (type name, primary key) the object is known
+        by in graph snapshots, or None if it is not yet stored.
+
+        """
+        if not self.stored() or self.isnew():
+            return None
+        return (self.__class__.__name__, tuple(self.pk))
+
+def snapshotResolve(identity):
+    """Returns the stored object snapshotIdentity gave identity, or
+    None if it is no longer in the database.
+
+    """
+    return broom.db.read_safe(identity[0], *identity[1])
+
 
 BroomObject = sqlalchemy.ext.declarative.declarative_base(cls=BroomObjectBase,
                                                           name='BroomObject',
@@ -371,6 +389,19 @@ def field(f=0, flags=ReadOnly, *args, **kwargs):
     return FieldDescriptor(f, flags, f.__name__, *args, **kwargs)
 
 
+def asyncfield(f=0, flags=ReadOnly, *args, **kwargs):
+    """Declare an on-graph field computed by a coroutine function.
+
+    Read it with await obj.Field.valueAsync(); within it, other
+    asynchronous fields are awaited the same way.
+
+    """
+    if not isinstance(f, types.FunctionType):
+        def wrapper(g):
+            return asyncfield(g, f, *args, **kwargs)
+        return wrapper
+    return field(f, flags|Async, *args, **kwargs)
+
 # TODO: Merge with 'field' above.
 def stored(ref):
     if not isinstance(ref, str):
@@ -1,205 +1,292 @@
+"""Static analysis of graph methods.
+
+BroomParser reads a graph method's source and finds the fields of
+the same object it calls -- self.Y(), self.Z(1, x) -- without running
+it, so that inputs can be scheduled, and edges built, before a node
+is first evaluated (see Graph.nodeStaticInputs).
+
+Only what can be known from the source is reported: a call counts if
+each of its arguments is a literal or one of the method's own
+parameters (never reassigned).  Anything else that could read a
+field of self -- a call with computed arguments, self.Y passed
+around, self handed to another function -- makes the result
+incomplete, as do fields read through other objects, which this
+does not follow:
+
+    def X(self):
+        y = self.Y()
+        return y.Z()            # Y is known; Y's Z is not.
+
+Reads that only happen on some paths (in a branch, a loop, after an
+early return) are marked conditional.
+
+"""
+
 import ast
+import inspect
+import textwrap
 
 class BroomRef(object):
     """A reference to an AST node parsed by the BroomParser.
 
-    (Don't confuse AST nodes with graph nodes; they are different.
+    (Don't confuse AST nodes with graph nodes; they are different.)
 
     """
     def __init__(self, node):
         self.node = node
 
-    def __hash__(self):
-        return hash(self.id.name)
-
-class BroomNameRef(BroomRef):
+class BroomArgRef(BroomRef):
+    """A reference to the method's index'th argument (after self)."""
 
-    def __init__(self, node):
+    def __init__(self, node, index):
         self.node = node
+        self.index = index
 
-    def __hash__(self):
-        return hash(self.node.id)
+    def __repr__(self):
+        return '<arg %d>' % self.index
 
-class BroomArgRef(BroomRef):
+class BroomInput(object):
+    """A field the method reads, with its arguments: each either a
+    value or a BroomArgRef.
 
-    def __init__(self, node):
-        self.node = node
+    """
+    def __init__(self, name, args, conditional=False):
+        self.name = name
+        self.args = args
+        self.conditional = conditional
 
-class BroomSelfRef(BroomRef):
+    def bind(self, args):
+        """Returns the arguments the field is read with when the
+        method is called with args, or None if that isn't known.
 
-    def __init__(self, node):
-        self.node = node
+        """
+        bound = []
+        for arg in self.args:
+            if isinstance(arg, BroomArgRef):
+                if arg.index >= len(args):
+                    return None     # Defaulted.
+                arg = args[arg.index]
+            bound.append(arg)
+        return tuple(bound)
 
-class BroomGraphMethodRef(BroomRef):
+    def __repr__(self):
+        return '<input %s%r%s>' % (self.name, tuple(self.args), ' (conditional)' if self.conditional else '')
 
-    def __init__(self, node):
-        self.node = node
+class BroomDependencies(object):
+    """The inputs a method is known to read, in the order they
+    appear; complete is False if it may read others.
+
+    """
+    def __init__(self, inputs, complete):
+        self.inputs = inputs
+        self.complete = complete
+
+    def __repr__(self):
+        return '<dependencies %r%s>' % (self.inputs, '' if self.complete else ' (incomplete)')
+
+class _Dynamic(Exception):
+    pass
+
+# Statements after one of these, within a block that may not run,
+# may not run either.
+_EXITS = (ast.Return, ast.Raise, ast.Break, ast.Continue)
+
+_SCOPES = (ast.FunctionDef, ast.Lambda, ast.ClassDef) + \
+          ((ast.AsyncFunctionDef,) if hasattr(ast, 'AsyncFunctionDef') else ())
 
-class BroomParser(ast.NodeTransformer):
-    """Transform a decorated BroomObject into a version
-    that is aware of its dependencies without first
-    having to execute a call path through those
-    dependendencies.
+def _argName(arg):
+    # Python 3 has ast.arg; Python 2 a Name (or a Tuple, unpacked).
+    return getattr(arg, 'arg', None) or getattr(arg, 'id', None)
+
+def _exits(nodes):
+    """Returns True if any of nodes may leave the enclosing block."""
+    pending = list(nodes)
+    while pending:
+        node = pending.pop()
+        if isinstance(node, _EXITS):
+            return True
+        if not isinstance(node, _SCOPES):
+            pending.extend(ast.iter_child_nodes(node))
+    return False
+
+class BroomParser(ast.NodeVisitor):
+    """Finds the inputs of graph methods.
+
+    fieldNames, if given, are the names of the fields on the
+    methods' class; otherwise every method called on self is taken
+    to be one.
 
     """
-    # NOTES:
-    #
-    # The general strategy we'll try first here is
-    # to transform any node calls (and references?)
-    # into arguments of a graph method.
-    #
-    # For example, if I have the graph method:
-    #
-    # def X(self):
-    #    q = 20
-    #    return q * self.Y() * self.Z()
-    #
-    # then this will be rewritten into:
-    #
-    # def X(self, __INPUTS__):
-    #    q = 20
-    #    return q * __INPUTS__[0] * __INPUTS__[1]
-    #
-    # (We'll need to track which index maps to a given node.)
-    #
-    # def X(self, x):
-    #    return x * self.Y() * self.Z()
-    #
-    # becomes
-    #
-    # def X(self, __INPUTS__):
-    #    return __INPUTS__[0] * __INPUTS__[1] * __INPUTS__[2]
-    #
-    # [That is, arguments to graph methods are themselves on the
-    # graph.]
-    #
-    # def X(self):
-    #     return self.Y().Z()
-    #
-    # becomes
-    #
-    # def X(self, __INPUTS__):
-    #     return __INPUTS__[0].Z()
-    #
-    # or does it?  I think it should.
-    #
-    # Can we track things that are copied off?  Let's see:
-    #
-    # def X(self):
-    #    y = self.Y()
-    #    z = y.Z()
-    #    return z
-    #
-    # If we do this naively:
-    #
-    # def X(self, __INPUTS__):
-    #    y = __INPUTS__[0]
-    #    z = y.Z()
-    #    return z
-    #
-    # then will this work?  No, because we've now lost detail
-    # on the fact that X depends on Z.  I can get the right
-    # results when computing the node, but if I haven't done
-    # that then I don't know, from this parser, that X depends
-    # on Y's Z.  I know it depends on Y, but not on Y's Z.
-    #
-    # How might we handle this? One way is to track assignments
-    # from graph field calls.
-    #
-    # For example, if I assign to y from a graph node then
-    # I can note that it's a graph method.  If y is then changed
-    # to a non-graph method, then I can remove that notation.
-    # If Z is called via y, then I know whether it was called
-    # as a graph method or not.
-    #
-    # TODO
-    # ----
-    # Have to handle some other variables:
-    #     self
-    #     self.db       <-- This is on-graph.
-    #     broom.db        <-- This is on-graph but should we
-    #                       require self.db notation in object calls?
-    #
-    # If/then statements.  Do we defer these?
-    #
-    # List and list comprehensions.
-    #
-    #    The format [x for x in self.Y()]
-    #
-    # if tricky, because I won't know what x is until evaluation
-    # time.
-    #
-    # What about?
-    #
-    #   [x.Z() for x in self.Y()]
-    #
-    # Is this any better.  Well, theoretically, no, because
-    # self.Y() can return a bunch of other items.  I suppose
-    # this is the same as x if we track it.  We just have to
-    # know that the variable is a graph object and anything
-    # called from it is a graph method.
-    #
-    # The question is how tricky this becomes...
-    #
-    def __init__(self):
-        self._inputs = []
-        self._refs = set()
+    def __init__(self, fieldNames=None):
+        self._fieldNames = fieldNames
+
+    def parse(self, function):
+        """Returns the BroomDependencies of function, or None if its
+        source can't be found or parsed.
 
-    def parse(self, *args):
-        raise NotImplementedError()
+        """
+        try:
+            source = inspect.getsource(function)
+        except (IOError, OSError, TypeError):
+            return None
+        return self.parse_s(source)
 
     def parse_s(self, s):
-        """Test parser for arbitrary Python code strings."""
-        raise NotImplementedError()
+        """Returns the BroomDependencies of the first function
+        defined in the source string s, or None if there isn't one.
 
-    def generic_visit(self, node):
-        return super(self.__class__, self).generic_visit(node)
+        """
+        try:
+            tree = ast.parse(textwrap.dedent(s))
+        except SyntaxError:
+            return None
+        for node in tree.body:
+            if isinstance(node, _SCOPES) and not isinstance(node, ast.ClassDef):
+                return self._parseFunction(node)
+        return None
 
-    def visit_Name(self, node):
-        node.ref = BroomNameRef(node)
-        self._refs.add(node.ref)
-        return node
-
-    def visit_FunctionDef(self, node):
-        for arg in node.args.args[1:]:
-            self._inputs.append(arg.id)
-        self._argc = len(node.args.args[1:])
-        node.args.args[1:] = []
-        for i,b in enumerate(node.body):
-            node.body[i] = self.visit(b)
-        if self._inputs:
-            node.args.args.append(ast.Name('__INPUTS__', ast.Param()))
-        return node
+    def _parseFunction(self, function):
+        args = function.args.args
+        if not args or function.args.vararg:
+            return BroomDependencies([], False)
+        assigned = set()
+        for node in ast.walk(function):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+                assigned.add(node.id)
+            elif isinstance(node, _SCOPES) and node is not function and not isinstance(node, ast.ClassDef):
+                assigned.update(_argName(arg) for arg in node.args.args)
+        self._self = _argName(args[0])
+        self._params = dict((_argName(arg), i) for i, arg in enumerate(args[1:])
+                            if _argName(arg) not in assigned)
+        self._inputs = []
+        self._inputsByKey = {}
+        self._complete = self._self not in assigned
+        self._conditional = 0
+        self._exited = False
+        for node in function.body:
+            self.visit(node)
+        return BroomDependencies(self._inputs, self._complete)
+
+    def _isSelf(self, node):
+        return isinstance(node, ast.Name) and node.id == self._self
+
+    def _isField(self, name):
+        return self._fieldNames is None or name in self._fieldNames
+
+    def _arg(self, node):
+        if isinstance(node, ast.Name) and node.id in self._params:
+            return BroomArgRef(node, self._params[node.id])
+        try:
+            value = ast.literal_eval(node)
+            hash(value)
+        except (ValueError, TypeError, SyntaxError):
+            raise _Dynamic()
+        return value
+
+    def _input(self, name, call):
+        for arg in call.args:
+            self.visit(arg)
+        for keyword in call.keywords:
+            self.visit(keyword.value)
+        try:
+            if call.keywords or getattr(call, 'starargs', None) or getattr(call, 'kwargs', None):
+                raise _Dynamic()
+            args = [self._arg(arg) for arg in call.args]
+        except _Dynamic:
+            self._complete = False
+            return
+        conditional = bool(self._conditional) or self._exited
+        key = (name, tuple((BroomArgRef, arg.index) if isinstance(arg, BroomArgRef) else arg
+                           for arg in args))
+        known = self._inputsByKey.get(key)
+        if known is not None:
+            known.conditional = known.conditional and conditional
+            return
+        self._inputsByKey[key] = BroomInput(name, args, conditional)
+        self._inputs.append(self._inputsByKey[key])
+
+    def _visitConditionally(self, nodes):
+        self._conditional += 1
+        try:
+            for node in nodes:
+                self.visit(node)
+        finally:
+            self._conditional -= 1
+        if _exits(nodes):
+            self._exited = True
 
     def visit_Call(self, node):
-        node.func = self.visit(node.func)
-        if isinstance(node.func, ast.Name) and node.func.id in self._inputs:
-            return ast.Name('__INPUTS__', ast.Load())
-        return self.generic_visit(node)
+        func = node.func
+        if isinstance(func, ast.Attribute):
+            if self._isSelf(func.value) and self._isField(func.attr):
+                return self._input(func.attr, node)
+            # self.Y.valueAsync(), within asynchronous fields.
+            if func.attr == 'valueAsync' and isinstance(func.value, ast.Attribute) \
+                    and self._isSelf(func.value.value) and self._isField(func.value.attr):
+                return self._input(func.value.attr, node)
+        self.generic_visit(node)
 
-    def visit_Return(self, node):
-        node.value = self.visit(node.value)
-        return node
+    def visit_Attribute(self, node):
+        if self._isSelf(node.value):
+            if self._fieldNames is not None and node.attr in self._fieldNames:
+                self._complete = False      # A field used other than by calling it.
+            return
+        self.generic_visit(node)
 
+    def visit_Name(self, node):
+        if node.id == self._self:
+            self._complete = False          # self itself handed on.
 
-s = """
-def X(self, x):
-    z = x + self.Y() + self.Y()
-    return self.Z() + z
-"""
+    def visit_If(self, node):
+        self.visit(node.test)
+        self._visitConditionally(node.body + node.orelse)
 
-t = """
-def X(self, __INPUTS__):
-    return __INPUTS__[0]
-"""
+    def visit_For(self, node):
+        self.visit(node.iter)
+        self.visit(node.target)
+        self._visitConditionally(node.body + node.orelse)
+
+    visit_AsyncFor = visit_For
+
+    def visit_While(self, node):
+        self._visitConditionally([node.test] + node.body + node.orelse)
+
+    def visit_Try(self, node):
+        for child in node.body:
+            self.visit(child)
+        self._visitConditionally(node.handlers + node.orelse + node.finalbody)
+
+    visit_TryStar = visit_Try
+
+    def visit_Match(self, node):
+        self.visit(node.subject)
+        self._visitConditionally(node.cases)
+
+    # Python 2.
+    def visit_TryExcept(self, node):
+        for child in node.body:
+            self.visit(child)
+        self._visitConditionally(node.handlers + node.orelse)
+
+    def visit_TryFinally(self, node):
+        for child in node.body:
+            self.visit(child)
+        self._visitConditionally(node.finalbody)
+
+    def visit_IfExp(self, node):
+        self.visit(node.test)
+        self._visitConditionally([node.body, node.orelse])
 
-node = ast.parse(s)
-visitor = BroomParser()
-visitor.visit(node)
+    def visit_BoolOp(self, node):
+        self.visit(node.values[0])
+        self._visitConditionally(node.values[1:])
 
-for r in visitor._refs:
-    print r.node.id
-print visitor._refs
+    def _visitScope(self, node):
+        # What a nested function or comprehension reads, it reads
+        # only if (and whenever) it is run; its returns are its own.
+        exited = self._exited
+        self._visitConditionally(list(ast.iter_child_nodes(node)))
+        self._exited = exited
 
-import codegen
-print codegen.to_source(node)
+    visit_Lambda = visit_FunctionDef = visit_AsyncFunctionDef = visit_ClassDef = _visitScope
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = _visitScope
@@ -0,0 +1,266 @@
+"""A persistent (immutable) hash map.
+
+PersistentMap is a hash array mapped trie: a tree of nodes, each
+indexed by the next five bits of a key's hash, so that a lookup
+touches at most a handful of nodes however many keys there are,
+and an update copies only the nodes on the path to the key and
+shares the rest with the map it was made from.
+
+The graph uses these to flatten the layers of nested scenarios
+(see GraphDataStore.nodeData).
+
+"""
+
+__all__ = ['PersistentMap']
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH = (1 << 64) - 1
+
+def _hash(key):
+    return hash(key) & _HASH
+
+def _index(bitmap, bit):
+    return bin(bitmap & (bit - 1)).count('1')
+
+# A node's slots hold either a (hash, key, value) tuple or another
+# node.  Keys whose hashes are equal in full share a _Collision.
+
+class _Bitmap(object):
+    __slots__ = ('bitmap', 'slots')
+
+    def __init__(self, bitmap, slots):
+        self.bitmap = bitmap
+        self.slots = slots
+
+class _Collision(object):
+    __slots__ = ('hash', 'entries')
+
+    def __init__(self, hash, entries):
+        self.hash = hash
+        self.entries = entries      # ((key, value), ...)
+
+def _merge(entry, other, shift):
+    """Returns a node holding two entries with different keys."""
+    if entry[0] == other[0]:
+        return _Collision(entry[0], ((entry[1], entry[2]), (other[1], other[2])))
+    i = (entry[0] >> shift) & _MASK
+    j = (other[0] >> shift) & _MASK
+    if i == j:
+        return _Bitmap(1 << i, (_merge(entry, other, shift + _BITS),))
+    if i > j:
+        entry, other = other, entry
+        i, j = j, i
+    return _Bitmap((1 << i) | (1 << j), (entry, other))
+
+def _set(node, shift, h, key, value):
+    """Returns node with key set to value, and whether key is new."""
+    if type(node) is _Collision:
+        if h != node.hash:
+            # Another hash down the same path, so split it off here.
+            node = _Bitmap(1 << ((node.hash >> shift) & _MASK), (node,))
+            return _set(node, shift, h, key, value)
+        entries = node.entries
+        for i, (k, v) in enumerate(entries):
+            if k is key or k == key:
+                if v is value:
+                    return node, False
+                return _Collision(h, entries[:i] + ((key, value),) + entries[i + 1:]), False
+        return _Collision(h, entries + ((key, value),)), True
+    bit = 1 << ((h >> shift) & _MASK)
+    index = _index(node.bitmap, bit)
+    slots = node.slots
+    if not node.bitmap & bit:
+        return _Bitmap(node.bitmap | bit, slots[:index] + ((h, key, value),) + slots[index:]), True
+    slot = slots[index]
+    if type(slot) is tuple:
+        if slot[0] == h and (slot[1] is key or slot[1] == key):
+            if slot[2] is value:
+                return node, False
+            replacement, added = (h, key, value), False
+        else:
+            replacement, added = _merge(slot, (h, key, value), shift + _BITS), True
+    else:
+        replacement, added = _set(slot, shift + _BITS, h, key, value)
+        if replacement is slot:
+            return node, False
+    return _Bitmap(node.bitmap, slots[:index] + (replacement,) + slots[index + 1:]), added
+
+def _discard(node, shift, h, key):
+    """Returns node without key (a lone entry or None if that
+    leaves at most one), and whether key was there.
+
+    """
+    if type(node) is _Collision:
+        if h != node.hash:
+            return node, False
+        entries = tuple((k, v) for k, v in node.entries if not (k is key or k == key))
+        if len(entries) == len(node.entries):
+            return node, False
+        if len(entries) == 1:
+            return (h,) + entries[0], True
+        return _Collision(h, entries), True
+    bit = 1 << ((h >> shift) & _MASK)
+    if not node.bitmap & bit:
+        return node, False
+    index = _index(node.bitmap, bit)
+    slots = node.slots
+    slot = slots[index]
+    if type(slot) is tuple:
+        if slot[0] != h or not (slot[1] is key or slot[1] == key):
+            return node, False
+        replacement = None
+    else:
+        replacement, removed = _discard(slot, shift + _BITS, h, key)
+        if not removed:
+            return node, False
+    if replacement is None:
+        bitmap = node.bitmap & ~bit
+        slots = slots[:index] + slots[index + 1:]
+    else:
+        bitmap = node.bitmap
+        slots = slots[:index] + (replacement,) + slots[index + 1:]
+    if not slots:
+        return None, True
+    if len(slots) == 1 and type(slots[0]) is tuple:
+        return slots[0], True       # Pulled up into the parent.
+    return _Bitmap(bitmap, slots), True
+
+def _items(node):
+    if type(node) is _Collision:
+        for item in node.entries:
+            yield item
+        return
+    for slot in node.slots:
+        if type(slot) is tuple:
+            yield slot[1], slot[2]
+        else:
+            for item in _items(slot):
+                yield item
+
+def _subtreeItems(node):
+    if node is None:
+        return ()
+    if type(node) is tuple:
+        return ((node[1], node[2]),)
+    return _items(node)
+
+def _diff(node, other, shift):
+    """Yields (key, value, other value) for each key whose values
+    (compared by identity) in two subtrees at the same path differ,
+    with _missing for a key one of them lacks.  Subtrees they share
+    are skipped.
+
+    """
+    if node is other:
+        return
+    if type(node) is _Bitmap and type(other) is _Bitmap:
+        bitmap = node.bitmap | other.bitmap
+        for i in range(1 << _BITS):
+            bit = 1 << i
+            if not bitmap & bit:
+                continue
+            slot = node.slots[_index(node.bitmap, bit)] if node.bitmap & bit else None
+            otherSlot = other.slots[_index(other.bitmap, bit)] if other.bitmap & bit else None
+            for item in _diff(slot, otherSlot, shift + _BITS):
+                yield item
+        return
+    # A leaf, a collision, or nothing on either side: what is left
+    # below here is small, so compare it key by key.
+    others = dict(_subtreeItems(other))
+    for key, value in _subtreeItems(node):
+        otherValue = others.pop(key, _missing)
+        if otherValue is not value:
+            yield key, value, otherValue
+    for key, otherValue in others.items():
+        yield key, _missing, otherValue
+
+class PersistentMap(object):
+    """An immutable mapping; set() and discard() return new maps."""
+
+    __slots__ = ('_root', '_count')
+
+    def __init__(self, root=None, count=0):
+        self._root = root
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, key):
+        return self.get(key, _missing) is not _missing
+
+    def __iter__(self):
+        for key, value in self.items():
+            yield key
+
+    def items(self):
+        if self._root is None:
+            return iter(())
+        return _items(self._root)
+
+    def get(self, key, default=None):
+        node = self._root
+        h = hash(key) & _HASH
+        shift = 0
+        while node is not None:
+            if type(node) is _Collision:
+                if node.hash == h:
+                    for k, v in node.entries:
+                        if k is key or k == key:
+                            return v
+                return default
+            bit = 1 << ((h >> shift) & _MASK)
+            if not node.bitmap & bit:
+                return default
+            node = node.slots[bin(node.bitmap & (bit - 1)).count('1')]
+            if type(node) is tuple:
+                if node[0] == h and (node[1] is key or node[1] == key):
+                    return node[2]
+                return default
+            shift += _BITS
+        return default
+
+    def set(self, key, value):
+        h = _hash(key)
+        if self._root is None:
+            return PersistentMap(_Bitmap(1 << (h & _MASK), ((h, key, value),)), 1)
+        root, added = _set(self._root, 0, h, key, value)
+        if root is self._root:
+            return self
+        return PersistentMap(root, self._count + added)
+
+    def discard(self, key):
+        if self._root is None:
+            return self
+        h = _hash(key)
+        root, removed = _discard(self._root, 0, h, key)
+        if not removed:
+            return self
+        if type(root) is tuple:
+            root = _Bitmap(1 << (root[0] & _MASK), (root,))
+        return PersistentMap(root, self._count - 1)
+
+    def diff(self, other, default=None):
+        """Yields (key, value, other's value) for every key whose
+        value here is not (by identity) its value in other, giving
+        default for a value either lacks.  Only the parts of the two
+        maps that aren't shared are looked at, so comparing a map
+        with one it was made from takes time in proportion to the
+        changes between them.
+
+        """
+        for key, value, otherValue in _diff(self._root, other._root, 0):
+            yield (key,
+                   default if value is _missing else value,
+                   default if otherValue is _missing else otherValue)
+
+    def update(self, items):
+        result = self
+        for key, value in items:
+            result = result.set(key, value)
+        return result
+
+_missing = object()
+
+EMPTY = PersistentMap()
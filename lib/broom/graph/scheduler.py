@@ -0,0 +1,245 @@
+"""Parallel evaluation of the graph.
+
+A node's inputs are only known once it has been evaluated, so the
+schedulers here work from the edges recorded by earlier
+evaluations: the invalid nodes below the ones asked for are
+computed on a pool of workers, each as soon as the invalid inputs
+it is known to read are done, and the results are then read back
+in the calling thread.  A node with no recorded edges is taken to
+read the inputs it is statically known to read (see
+Graph.nodeStaticInputs); anything else not yet known to the graph is
+simply computed by whichever worker comes across it.
+
+"""
+
+import multiprocessing
+
+from .graph import NodeData
+
+try:
+    import concurrent.futures as futures
+except ImportError:     # Python 2 without the futures backport.
+    futures = None
+
+try:
+    import queue
+except ImportError:     # Python 2.
+    import Queue as queue
+
+__all__ = ['GraphScheduler', 'GraphProcessScheduler']
+
+class GraphScheduler(object):
+    """Computes independent nodes concurrently on a pool of threads,
+    which suits nodes that mostly wait on I/O.
+
+    The pool is any concurrent.futures executor; by default a
+    ThreadPoolExecutor with the given number of workers is created
+    (and owned) by the scheduler, which needs the concurrent.futures
+    module (or, on Python 2, the futures backport).
+
+    """
+    def __init__(self, graph, executor=None, workers=None):
+        self._graph = graph
+        self._ownsExecutor = executor is None
+        if executor is None:
+            if futures is None:
+                raise RuntimeError("A thread pool needs the concurrent.futures module.")
+            executor = futures.ThreadPoolExecutor(max_workers=workers or multiprocessing.cpu_count())
+        self._executor = executor
+
+    @property
+    def graph(self):
+        return self._graph
+
+    @property
+    def executor(self):
+        return self._executor
+
+    def shutdown(self):
+        if self._ownsExecutor:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def nodeValue(self, node, dataStore=None):
+        return self.nodeValues([node], dataStore=dataStore)[0]
+
+    def nodeValues(self, nodes, dataStore=None):
+        """Returns the value of each node, computing what needs to be
+        computed in parallel.
+
+        The values are read in the calling thread once the workers
+        are done, so if it is itself computing a node they are
+        recorded as that node's inputs as usual.
+
+        """
+        graph = self._graph
+        dataStore = dataStore or graph.activeDataStore
+        pending, outputs = self._plan(nodes, dataStore)
+        if pending:
+            self._run(pending, outputs, dataStore)
+        return [graph.nodeValue(node, dataStore) for node in nodes]
+
+    def _current(self, node, dataStore):
+        """Returns True if node's value can be read as is, without
+        verifying or computing anything.
+
+        """
+        graph = self._graph
+        nodeData = dataStore.nodeData(node, createIfMissing=False)
+        if nodeData is None or not nodeData._flags & NodeData.VALID:
+            return False
+        return graph.invalidation == graph.EAGER \
+                or nodeData._flags & NodeData.FIXED \
+                or nodeData._verifiedAt == graph.revision
+
+    def _plan(self, nodes, dataStore):
+        """Finds the nodes that need computing below (and including)
+        nodes, by their recorded inputs.
+
+        Returns a dictionary giving the number of such inputs each
+        of them waits for, and another giving the nodes waiting on
+        each.
+
+        """
+        pending = {}
+        outputs = {}
+        stack = [node for node in nodes if not self._current(node, dataStore)]
+        for node in stack:
+            pending[node] = 0
+            outputs[node] = []
+        while stack:
+            node = stack.pop()
+            inputs = node.inputs
+            if not inputs:
+                # Never evaluated, say, so go by its source.
+                inputs = self._graph.nodeStaticInputs(node, conditional=False) or ()
+            for dependency in inputs:
+                if dependency.obj is None or self._current(dependency, dataStore):
+                    continue
+                if dependency not in pending:
+                    pending[dependency] = 0
+                    outputs[dependency] = []
+                    stack.append(dependency)
+                pending[node] += 1
+                outputs[dependency].append(node)
+        return pending, outputs
+
+    def _run(self, pending, outputs, dataStore):
+        stack = self._graph.activeDataStores
+        running = {}
+        done = queue.Queue()
+        def submit(node):
+            future = self._executor.submit(self._evaluate, node, dataStore, stack)
+            running[future] = node
+            future.add_done_callback(done.put)
+        for node, count in list(pending.items()):
+            if not count:
+                submit(node)
+        try:
+            while running:
+                future = done.get()
+                node = running.pop(future)
+                future.result()
+                for output in outputs[node]:
+                    pending[output] -= 1
+                    if not pending[output]:
+                        submit(output)
+        finally:
+            for future in running:
+                future.cancel()
+
+    def _evaluate(self, node, dataStore, stack):
+        """Computes node in a worker, within the caller's data stores."""
+        graph = self._graph
+        local = graph._state._activeDataStoreStack
+        saved = local.get()
+        local.set(stack)
+        try:
+            graph.nodeValue(node, dataStore)
+        finally:
+            local.set(saved)
+
+# The work handed to each forked worker by _forkInit (which the
+# pool runs in the worker, so other schedulers don't see it); see
+# GraphProcessScheduler._map.
+_forkWork = None
+
+def _forkInit(work):
+    global _forkWork
+    _forkWork = work
+
+def _forkEvaluate(i):
+    graph, dataStore, stack, nodes = _forkWork
+    node = nodes[i]
+    graph._state._activeDataStoreStack.set(stack)
+    value = graph.nodeValue(node, dataStore)
+    nodeData = dataStore.nodeData(node)
+    return value, [id(dependency) for dependency in nodeData._inputs or ()]
+
+class GraphProcessScheduler(GraphScheduler):
+    """Computes independent nodes concurrently in forked processes,
+    which suits CPU-bound nodes.
+
+    Work is done a level at a time: the nodes whose inputs are all
+    valid are computed in worker processes forked from this one, so
+    each sees the graph exactly as it stands, and their values (which
+    must be picklable) and the inputs they read are then stored back
+    into the graph here.  A node that read something the graph here
+    has never seen is left to be computed locally.
+
+    This relies on the 'fork' start method, so is POSIX only, and
+    should not be used while other threads are changing the graph.
+
+    """
+    def __init__(self, graph, workers=None):
+        self._graph = graph
+        self._workers = workers or multiprocessing.cpu_count()
+        self._ownsExecutor = False
+        self._executor = None
+
+    def _run(self, pending, outputs, dataStore):
+        graph = self._graph
+        stack = graph.activeDataStores
+        ready = [node for node, count in pending.items() if not count]
+        # Computing here creates no nodes, so the nodes the workers
+        # can name are the same at every level.
+        nodesByID = dict((id(node), node) for node in graph._nodesByKey.values())
+        while ready:
+            revision = graph.revision
+            results = self._map(ready, dataStore, stack)
+            following = []
+            for node, (value, inputIDs) in zip(ready, results):
+                inputs = [nodesByID.get(inputID) for inputID in inputIDs]
+                if None not in inputs:
+                    self._store(node, dataStore, value, inputs, revision)
+                for output in outputs[node]:
+                    pending[output] -= 1
+                    if not pending[output]:
+                        following.append(output)
+            ready = following
+
+    def _map(self, nodes, dataStore, stack):
+        getContext = getattr(multiprocessing, 'get_context', None)
+        context = getContext('fork') if getContext else multiprocessing
+        work = (self._graph, dataStore, stack, nodes)
+        pool = context.Pool(min(self._workers, len(nodes)), _forkInit, (work,))
+        try:
+            return pool.map(_forkEvaluate, range(len(nodes)))
+        finally:
+            pool.terminate()
+
+    def _store(self, node, dataStore, value, inputs, revision):
+        """Keeps a value computed by a worker as if it had been
+        computed here, at revision.
+
+        """
+        graph = self._graph
+        nodeData = dataStore.nodeData(node, searchParent=False)
+        with graph._lock:
+            graph._nodeTrackInputs(node, nodeData, inputs, True)
+            graph._nodeStore(node, nodeData, value, revision)
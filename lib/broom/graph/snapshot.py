@@ -0,0 +1,185 @@
+"""Snapshots of a graph's computed values, for a warm start.
+
+A snapshot holds, for each valid computed value of a SERIALIZABLE
+field on an object with a stable identity, the value along with the
+identity and value of every input it read.  Objects within values
+are written as references to their identities rather than copied.
+
+Once loaded into another process, the snapshot is consulted
+whenever a node is about to be computed: if it holds an entry for
+the node, each of the node's recorded inputs is read -- through the
+graph, so from the current stored data and itself possibly restored
+from the snapshot -- and if every one still has its recorded value
+the snapshot's value is used instead of computing it.  Entries are
+only unpickled as they are used.
+
+By default an object's identity is whatever its snapshotIdentity()
+method returns (None for an object without one); BroomObjects give
+(type name, primary key) once stored.  Identities must be picklable,
+and resolvable back to objects by the resolve function given.
+
+"""
+
+import io
+import pickle
+
+from .graph import NodeData
+
+__all__ = ['GraphSnapshot']
+
+_PLAIN = (type(None), bool, int, float, str, bytes, type(u''))
+try:
+    _PLAIN += (long,)
+except NameError:       # Python 3.
+    pass
+
+def _plain(value):
+    if isinstance(value, tuple):
+        return all(_plain(v) for v in value)
+    return isinstance(value, _PLAIN)
+
+def _identify(obj):
+    snapshotIdentity = getattr(obj, 'snapshotIdentity', None)
+    return snapshotIdentity() if snapshotIdentity is not None else None
+
+class _Unresolved(Exception):
+    pass
+
+class GraphSnapshot(object):
+
+    VERSION = 1
+
+    def __init__(self, graph, resolve=None, identify=None):
+        self._graph = graph
+        self._resolve = resolve
+        self._identify = identify or _identify
+        self._entries = {}      # node ID -> pickled (value, [(input node ID, value), ...])
+        self._restored = 0
+
+    @property
+    def graph(self):
+        return self._graph
+
+    @property
+    def restored(self):
+        return self._restored
+
+    def __len__(self):
+        return len(self._entries)
+
+    def nodeID(self, node):
+        """Returns a stable identifier for node, or None if it has
+        none.
+
+        """
+        obj = node.obj
+        if obj is None or not _plain(node.args):
+            return None
+        identity = self._identify(obj)
+        if identity is None:
+            return None
+        return (identity, node.name, node.args)
+
+    def save(self, path):
+        """Writes the graph's current, computed values in its root
+        data store to path.  Returns the number of values written.
+
+        """
+        graph = self._graph
+        dataStore = graph.rootDataStore
+        entries = {}
+        for nodeData in list(dataStore._nodeDataByNodeKey.values()):
+            node = nodeData._node
+            if not node.serializable or nodeData._flags & NodeData.FIXED \
+                    or not graph._nodeCurrent(nodeData, dataStore, verify=False):
+                continue
+            nodeID = self.nodeID(node)
+            if nodeID is None:
+                continue
+            inputs = []
+            for dependency in nodeData._inputs or ():
+                dependencyID = self.nodeID(dependency)
+                dependencyData = dataStore.nodeData(dependency, createIfMissing=False)
+                if dependencyID is None or dependencyData is None \
+                        or not graph._nodeCurrent(dependencyData, dataStore, verify=False):
+                    break
+                inputs.append((dependencyID, dependencyData._value))
+            else:
+                try:
+                    entries[nodeID] = self._dumps((nodeData._value, inputs))
+                except Exception:
+                    continue        # Not picklable, so not kept.
+        with open(path, 'wb') as f:
+            pickle.dump((self.VERSION, entries), f, pickle.HIGHEST_PROTOCOL)
+        return len(entries)
+
+    def load(self, path):
+        """Reads the snapshot at path, to be restored from lazily
+        once set on the graph (see Graph.setSnapshot).
+
+        """
+        with open(path, 'rb') as f:
+            version, entries = pickle.load(f)
+        if version != self.VERSION:
+            raise RuntimeError("Snapshot version %s is not supported." % version)
+        self._entries = entries
+
+    def restore(self, node):
+        """Returns (True, value) if the snapshot holds a value for
+        node that is still good, reading (and so recording) its
+        inputs to find out, and (False, None) otherwise.
+
+        Each entry is used at most once.
+
+        """
+        if not self._entries:
+            return False, None
+        nodeID = self.nodeID(node)
+        data = self._entries.pop(nodeID, None) if nodeID is not None else None
+        if data is None:
+            return False, None
+        graph = self._graph
+        try:
+            value, inputs = self._loads(data)
+        except Exception:
+            return False, None  # A referenced object has gone, say.
+        try:
+            for dependencyID, recorded in inputs:
+                dependency = self._nodeResolve(dependencyID)
+                current = graph.nodeValue(dependency, graph.rootDataStore)
+                if not graph._nodeValuesEqual(dependency, recorded, current):
+                    return False, None
+        except _Unresolved:
+            return False, None
+        self._restored += 1
+        return True, value
+
+    def _nodeResolve(self, nodeID):
+        identity, name, args = nodeID
+        obj = self._resolve(identity) if self._resolve else None
+        field = getattr(obj, name, None)
+        if field is None:
+            raise _Unresolved(nodeID)
+        return self._graph.nodeResolve(field, args=args)
+
+    def _dumps(self, value):
+        f = io.BytesIO()
+        pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+        def persistent_id(obj):
+            if isinstance(obj, _PLAIN):
+                return None
+            identity = self._identify(obj)
+            return None if identity is None else ('identity', identity)
+        pickler.persistent_id = persistent_id
+        pickler.dump(value)
+        return f.getvalue()
+
+    def _loads(self, data):
+        unpickler = pickle.Unpickler(io.BytesIO(data))
+        def persistent_load(pid):
+            obj = self._resolve(pid[1]) if self._resolve else None
+            if obj is None:
+                raise _Unresolved(pid)
+            return obj
+        unpickler.persistent_load = persistent_load
+        return unpickler.load()
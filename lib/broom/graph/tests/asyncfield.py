@@ -0,0 +1,95 @@
+"""Unit tests for asynchronous fields.
+
+Coroutine functions need Python 3, and so do these tests.
+
+"""
+
+import asyncio
+import unittest
+
+import broom.graph.graph as graph
+
+def field(f, flags=graph.NodeDescriptor.READONLY):
+    return graph.NodeDescriptor(f, flags, f.__name__)
+
+def asyncfield(f):
+    return field(f, graph.NodeDescriptor.ASYNC)
+
+class Remote(object):
+    calls = 0
+
+    def __init__(self):
+        for k in ('A', 'Fetch', 'Other', 'Both', 'Label'):
+            setattr(self, k, graph.NodeDescriptorBound(self, getattr(self.__class__, k)))
+
+    def A(self):
+        return 1
+    A = field(A, graph.NodeDescriptor.SETTABLE)
+
+    @asyncfield
+    async def Fetch(self):
+        Remote.calls += 1
+        await asyncio.sleep(0)
+        return self.A() * 10
+
+    @asyncfield
+    async def Other(self):
+        await asyncio.sleep(0)
+        return await self.Fetch.valueAsync() + 1
+
+    @asyncfield
+    async def Both(self):
+        fetch, other = await asyncio.gather(self.Fetch.valueAsync(), self.Other.valueAsync())
+        return fetch + other
+
+    def Label(self):
+        return 'fetched %d' % self.Fetch()
+    Label = field(Label)
+
+class AsyncFieldTestCase(unittest.TestCase):
+
+    graphKwargs = {}
+
+    def setUp(self):
+        self._savedGraph = graph._graph
+        graph._graph = graph.Graph(**self.graphKwargs)
+        Remote.calls = 0
+
+    def tearDown(self):
+        graph._graph = self._savedGraph
+
+    def run_(self, f):
+        async def main():
+            return await asyncio.wait_for(f(), 5)
+        return asyncio.run(main())
+
+    def test_value(self):
+        obj = Remote()
+        self.assertEqual(self.run_(obj.Both.valueAsync), 21)
+        self.assertEqual(Remote.calls, 1)
+        self.assertEqual(set(obj.Both.node().inputs), set([obj.Fetch.node(), obj.Other.node()]))
+        self.assertEqual(list(obj.Fetch.node().inputs), [obj.A.node()])
+        self.assertTrue(obj.Both.node().valid())
+
+    def test_invalidation(self):
+        obj = Remote()
+        self.assertEqual(self.run_(obj.Both.valueAsync), 21)
+        obj.A.setValue(2)
+        self.assertEqual(self.run_(obj.Both.valueAsync), 41)
+        self.assertEqual(Remote.calls, 2)
+
+    def test_sync_reader(self):
+        obj = Remote()
+        self.assertEqual(obj.Label(), 'fetched 10')
+        self.assertEqual(list(obj.Label.node().inputs), [obj.Fetch.node()])
+        async def read():
+            return obj.Label()
+        obj.A.setValue(2)
+        self.assertRaises(RuntimeError, self.run_, read)
+
+class LazyAsyncFieldTestCase(AsyncFieldTestCase):
+
+    graphKwargs = {'invalidation': graph.Graph.LAZY}
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,965 @@
+"""Unit tests for the graph engine.
+
+These exercise broom.graph.graph directly, using plain objects
+rather than BroomObjects, so they need no database.
+
+"""
+
+import gc
+import json
+import threading
+import unittest
+
+import broom.graph.graph as graph
+
+Settable = graph.NodeDescriptor.SETTABLE
+
+def field(f=graph.NodeDescriptor.READONLY, **kwargs):
+    """Like broom.field, without the model."""
+    if not callable(f):
+        def wrapper(g):
+            return graph.NodeDescriptor(g, f, g.__name__, **kwargs)
+        return wrapper
+    return graph.NodeDescriptor(f, graph.NodeDescriptor.READONLY, f.__name__, **kwargs)
+
+class GraphObject(object):
+    """A minimal stand-in for BroomObject: binds each descriptor
+    on the class to the instance.
+
+    """
+    def __init__(self, **kwargs):
+        for k in dir(self.__class__):
+            v = getattr(self.__class__, k)
+            if isinstance(v, graph.NodeDescriptor):
+                setattr(self, k, graph.NodeDescriptorBound(self, v))
+        for k, v in kwargs.items():
+            getattr(self, k).setValue(v)
+
+class Adder(GraphObject):
+    calls = 0
+
+    @field(Settable)
+    def A(self):
+        return 1
+
+    @field(Settable)
+    def B(self):
+        return 2
+
+    @field
+    def Sum(self):
+        Adder.calls += 1
+        return self.A() + self.B()
+
+    @field
+    def Double(self):
+        return self.Sum() * 2
+
+class Picker(GraphObject):
+    calls = 0
+
+    @field(Settable)
+    def Flag(self):
+        return True
+
+    @field(Settable)
+    def A(self):
+        return 'a'
+
+    @field(Settable)
+    def B(self):
+        return 'b'
+
+    @field
+    def Pick(self):
+        Picker.calls += 1
+        return self.A() if self.Flag() else self.B()
+
+class Parity(GraphObject):
+    calls = 0
+
+    @field(Settable)
+    def Items(self):
+        return [1]
+
+    @field
+    def Count(self):
+        return len(self.Items())
+
+    @field
+    def Even(self):
+        return self.Count() % 2 == 0
+
+    @field
+    def Label(self):
+        Parity.calls += 1
+        return 'even' if self.Even() else 'odd'
+
+    @field(fingerprint=len)
+    def Copy(self):
+        return list(self.Items())
+
+    @field
+    def CopyLength(self):
+        Parity.calls += 1
+        return len(self.Copy())
+
+class Chain(GraphObject):
+
+    @field(Settable)
+    def Base(self):
+        return 0
+
+    @field
+    def Link(self, i):
+        return self.Base() if i == 0 else self.Link(i - 1) + 1
+
+class Gate(GraphObject):
+    """Fields that block until released, for the thread tests."""
+    calls = 0
+
+    def __init__(self, **kwargs):
+        super(Gate, self).__init__(**kwargs)
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    @field(Settable)
+    def A(self):
+        return 1
+
+    @field
+    def Slow(self):
+        Gate.calls += 1
+        value = self.A()
+        self.entered.set()
+        self.release.wait(5)
+        return value
+
+def run(*functions):
+    """Runs each function in its own thread; returns their results."""
+    results = [None] * len(functions)
+    def target(i):
+        results[i] = functions[i]()
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(len(functions))]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+class Branch(GraphObject):
+
+    @field(Settable)
+    def X(self):
+        return 0
+
+    @field
+    def Scaled(self):
+        return self.X() * 10
+
+    @field
+    def Result(self):
+        return self.Scaled() if self.X() else -1
+
+class Threshold(GraphObject):
+
+    @field(Settable)
+    def W(self):
+        return 1
+
+    @field
+    def N(self):
+        return self.W() * 3
+
+    @field
+    def T(self):
+        return self.W() if self.W() < 5 else self.N()
+
+class Kid(GraphObject):
+
+    @field(Settable)
+    def V(self):
+        return 1
+
+class Family(GraphObject):
+
+    @field(Settable)
+    def Kids(self):
+        return []
+
+    @field
+    def Total(self):
+        return sum(kid.V() for kid in self.Kids())
+
+class Lookup(GraphObject):
+    calls = 0
+
+    @field(Settable)
+    def Base(self):
+        return 1
+
+    @field
+    def Resolve(self, options, names=()):
+        Lookup.calls += 1
+        return [options.get(name, self.Base()) for name in names]
+
+class Cell(object):
+    """Binds its fields lazily, as BroomObjects do (see
+    graph.NodeDescriptorBinding).
+
+    """
+    bound = 0
+
+    def _value(self):
+        return 1
+
+    def _double(self):
+        return self.Value() * 2
+
+    Value = graph.NodeDescriptorBinding(_value, Settable, 'Value')
+    Double = graph.NodeDescriptorBinding(_double, graph.NodeDescriptor.READONLY, 'Double')
+
+class CountingBinding(graph.NodeDescriptorBinding):
+
+    def bind(self, obj):
+        Cell.bound += 1
+        return super(CountingBinding, self).bind(obj)
+
+class CountedCell(Cell):
+
+    Value = CountingBinding(Cell._value, Settable, 'Value')
+
+class GraphTestCase(unittest.TestCase):
+
+    graphKwargs = {}
+
+    def setUp(self):
+        self._savedGraph = graph._graph
+        graph._graph = graph.Graph(**self.graphKwargs)
+        Adder.calls = 0
+        Picker.calls = 0
+        Parity.calls = 0
+        Gate.calls = 0
+
+    def tearDown(self):
+        graph._graph = self._savedGraph
+
+class NodeTestCase(GraphTestCase):
+
+    def test_slots(self):
+        obj = Adder()
+        node = obj.Sum.node()
+        nodeData = graph._graph.nodeData(node)
+        self.assertFalse(hasattr(node, '__dict__'))
+        self.assertFalse(hasattr(nodeData, '__dict__'))
+
+    def test_flags(self):
+        obj = Adder()
+        self.assertTrue(obj.A.node().settable)
+        self.assertTrue(obj.A.node().overlayable)
+        self.assertFalse(obj.Sum.node().settable)
+
+    def test_edges(self):
+        obj = Adder()
+        self.assertEqual(obj.Double(), 6)
+        self.assertEqual(set(obj.Sum.node().inputs), set([obj.A.node(), obj.B.node()]))
+        self.assertEqual(list(obj.Sum.node().outputs), [obj.Double.node()])
+        self.assertEqual(list(obj.Double.node().outputs), [])
+
+    def test_stale_inputs(self):
+        obj = Picker()
+        self.assertEqual(obj.Pick(), 'a')
+        self.assertEqual(set(obj.Pick.node().inputs), set([obj.Flag.node(), obj.A.node()]))
+        obj.Flag.setValue(False)
+        self.assertEqual(obj.Pick(), 'b')
+        self.assertEqual(set(obj.Pick.node().inputs), set([obj.Flag.node(), obj.B.node()]))
+        self.assertEqual(list(obj.A.node().outputs), [])
+        obj.A.setValue('x')
+        self.assertTrue(obj.Pick.node().valid())
+        self.assertEqual(Picker.calls, 2)
+
+    def test_inputs_kept_for_other_data_stores(self):
+        obj = Picker()
+        self.assertEqual(obj.Pick(), 'a')
+        with graph.scenario():
+            obj.Flag.setWhatIf(False)
+            self.assertEqual(obj.Pick(), 'b')
+            obj.Flag.setWhatIf(True)
+            obj.Flag.setWhatIf(False)
+            self.assertEqual(obj.Pick(), 'b')
+        self.assertEqual(set(obj.Pick.node().inputs),
+                         set([obj.Flag.node(), obj.A.node(), obj.B.node()]))
+        obj.A.setValue('x')
+        self.assertEqual(obj.Pick(), 'x')
+
+    def test_inputs_pruned_after_exit(self):
+        obj = Picker()
+        self.assertEqual(obj.Pick(), 'a')
+        s = graph.scenario()
+        with s:
+            obj.Flag.setWhatIf(True)
+            self.assertEqual(obj.Pick(), 'a')
+        # The exited scenario doesn't hold on to A's edge ...
+        obj.Flag.setValue(False)
+        self.assertEqual(obj.Pick(), 'b')
+        self.assertEqual(set(obj.Pick.node().inputs), set([obj.Flag.node(), obj.B.node()]))
+        # ... but puts it back once re-entered.
+        with s:
+            self.assertEqual(obj.Pick(), 'a')
+            obj.A.setWhatIf('z')
+            self.assertEqual(obj.Pick(), 'z')
+
+class ArrayAdjacencyNodeTestCase(NodeTestCase):
+
+    graphKwargs = {'adjacencyClass': graph.GraphArrayAdjacency}
+
+    def test_ids(self):
+        obj = Adder()
+        ids = [obj.A.node().id, obj.B.node().id, obj.Sum.node().id]
+        self.assertEqual(sorted(ids), [0, 1, 2])
+
+    def test_remove(self):
+        obj = Adder()
+        obj.Sum()
+        graph._graph.nodeRemoveDependency(obj.Sum.node(), obj.A.node())
+        self.assertEqual(list(obj.Sum.node().inputs), [obj.B.node()])
+        self.assertEqual(list(obj.A.node().outputs), [])
+
+class ReclaimTestCase(GraphTestCase):
+
+    def test_reclaim(self):
+        survivor = Adder()
+        obj = Adder()
+        obj.A.setValue(survivor.Sum())
+        self.assertEqual(obj.Double(), 10)
+        self.assertEqual(graph._graph.stats()['nodes'], 7)
+        del obj
+        gc.collect()
+        stats = graph._graph.stats()
+        self.assertEqual(stats['nodes'], 3)
+        self.assertEqual(stats['nodesReclaimed'], 4)
+        self.assertEqual(stats['nodeData'], 3)
+        self.assertEqual(list(survivor.Sum.node().outputs), [])
+        survivor.A.setValue(5)
+        self.assertEqual(survivor.Sum(), 7)
+
+    def test_collected_field(self):
+        obj = Adder()
+        read, unread = obj.Sum, obj.B
+        read()
+        del obj
+        gc.collect()
+        self.assertRaises(ReferenceError, read)
+        self.assertRaises(ReferenceError, unread)
+        self.assertRaises(ReferenceError, unread.setValue, 1)
+
+    def test_create_collected(self):
+        obj = Adder()
+        key = obj.B.key()
+        hash(key)       # As looking it up first would.
+        adjacency = graph._graph._adjacency
+        before = len(getattr(adjacency, '_nodes', ()))
+        del obj
+        gc.collect()
+        self.assertRaises(ReferenceError, graph._graph.nodeCreate, key, Adder.B)
+        self.assertEqual(len(getattr(adjacency, '_nodes', ())), before)
+        self.assertEqual(graph._graph.stats()['nodes'], 0)
+
+    def test_reused_node(self):
+        parent = Family()
+        kid = Kid()
+        parent.Kids.setValue([kid])
+        self.assertEqual(parent.Total(), 1)
+        parent.Kids.setValue([])
+        del kid
+        gc.collect()
+        graph._graph.nodesReclaim()
+        other = Kid()
+        parent.Kids.setValue([other])
+        self.assertEqual(parent.Total(), 1)
+        other.V.setValue(10)
+        self.assertEqual(parent.Total(), 10)
+
+class ArrayAdjacencyReclaimTestCase(ReclaimTestCase):
+
+    graphKwargs = {'adjacencyClass': graph.GraphArrayAdjacency}
+
+    def test_reclaim(self):
+        super(ArrayAdjacencyReclaimTestCase, self).test_reclaim()
+        dataStore = graph._graph.rootDataStore
+        self.assertEqual(sorted(id(d) for d in dataStore._nodeDataByID if d is not None),
+                         sorted(id(d) for d in dataStore._nodeDataByNodeKey.values()))
+
+class BindingTestCase(GraphTestCase):
+
+    def test_class_access(self):
+        self.assertTrue(isinstance(Cell.Value, graph.NodeDescriptorBinding))
+        self.assertEqual(Cell.Value.name, 'Value')
+
+    def test_lazy(self):
+        obj = Cell()
+        self.assertEqual(vars(obj), {})
+        field = obj.Double
+        self.assertTrue(isinstance(field, graph.NodeDescriptorBound))
+        self.assertTrue(field.obj is obj and field.descriptor is Cell.Double)
+        self.assertEqual(list(vars(obj)), ['Double'])
+        self.assertEqual(obj.Double(), 2)
+        self.assertEqual(sorted(vars(obj)), ['Double', 'Value'])
+
+    def test_cached(self):
+        Cell.bound = 0
+        obj = CountedCell()
+        field = obj.Value
+        self.assertTrue(obj.Value is field)
+        self.assertTrue(vars(obj)['Value'] is field)
+        self.assertEqual(Cell.bound, 1)
+        self.assertTrue(CountedCell().Value is not field)
+        self.assertEqual(Cell.bound, 2)
+
+    def test_values(self):
+        obj, other = Cell(), Cell()
+        obj.Value.setValue(5)
+        self.assertEqual(obj.Double(), 10)
+        self.assertEqual(other.Double(), 2)
+        self.assertTrue(obj.Double.node() is graph._graph.nodeResolve(obj.Double))
+
+class ValueTestCase(GraphTestCase):
+
+    def test_cached(self):
+        obj = Adder()
+        self.assertEqual(obj.Sum(), 3)
+        self.assertEqual(obj.Sum(), 3)
+        self.assertEqual(Adder.calls, 1)
+
+    def test_set_invalidates(self):
+        obj = Adder()
+        self.assertEqual(obj.Double(), 6)
+        obj.A.setValue(10)
+        self.assertFalse(obj.Sum.node().valid())
+        self.assertEqual(obj.Double(), 24)
+        obj.A.clearValue()
+        self.assertEqual(obj.Double(), 6)
+        self.assertEqual(Adder.calls, 3)
+
+    def test_set_readonly(self):
+        obj = Adder()
+        self.assertRaises(RuntimeError, obj.Sum.setValue, 1)
+
+    def test_subscription(self):
+        obj = Adder()
+        notified = []
+        obj.Double.subscribe(lambda descriptor: notified.append(descriptor.name))
+        obj.Double()
+        obj.A.setValue(5)
+        self.assertEqual(notified, ['Double'])
+
+    def test_dispatcher(self):
+        dispatcher = graph.GraphDispatcher(graph._graph, background=False)
+        graph._graph.setDispatcher(dispatcher)
+        obj = Adder()
+        notified = []
+        obj.Double.subscribe(lambda descriptor: notified.append(descriptor.name))
+        for value in (5, 6):
+            obj.Double()
+            obj.A.setValue(value)
+        self.assertEqual(notified, [])
+        self.assertEqual(dispatcher.pending, 1)
+        self.assertEqual(dispatcher.flush(), 1)
+        self.assertEqual(notified, ['Double'])
+        self.assertEqual(list(graph._graph._state._subscriptionsByNodeKey), [obj.Double.node().key])
+
+    def test_dispatcher_errors(self):
+        dispatcher = graph.GraphDispatcher(graph._graph, background=False)
+        graph._graph.setDispatcher(dispatcher)
+        obj = Adder()
+        notified = []
+        def fail(descriptor):
+            raise ValueError(descriptor.name)
+        obj.Sum.subscribe(fail)
+        obj.Double.subscribe(lambda descriptor: notified.append(descriptor.name))
+        obj.Double()
+        obj.A.setValue(5)
+        self.assertEqual(dispatcher.pending, 2)
+        # Whatever was queued behind the failure is kept for later.
+        self.assertRaises(ValueError, dispatcher.flush)
+        dispatcher.flush()
+        self.assertEqual(notified, ['Double'])
+        self.assertEqual(dispatcher.pending, 0)
+        errors = []
+        dispatcher = graph.GraphDispatcher(graph._graph, background=False, onError=errors.append)
+        graph._graph.setDispatcher(dispatcher)
+        obj.Double()
+        obj.A.setValue(6)
+        self.assertEqual(dispatcher.flush(), 1)
+        self.assertEqual(notified, ['Double', 'Double'])
+        self.assertEqual([e[0] for e in errors], [ValueError])
+
+    def test_dispatcher_background(self):
+        errors = []
+        dispatcher = graph.GraphDispatcher(graph._graph, onError=errors.append)
+        graph._graph.setDispatcher(dispatcher)
+        obj = Adder()
+        notified = []
+        def fail(descriptor):
+            raise ValueError(descriptor.name)
+        obj.Sum.subscribe(fail)
+        obj.Double.subscribe(lambda descriptor: notified.append(descriptor.name))
+        obj.Double()
+        obj.A.setValue(5)
+        self.assertTrue(dispatcher.wait(5))
+        self.assertEqual(notified, ['Double'])
+        self.assertEqual([e[0] for e in errors], [ValueError])
+        dispatcher.close()
+
+    def test_profiler(self):
+        profiler = graph._graph.setProfiling()
+        obj = Adder()
+        obj.Double()
+        obj.Double()
+        obj.A.setValue(5)
+        obj.Double()
+        self.assertTrue(graph._graph.setProfiling(False) is profiler)
+        obj.Double()
+        stats = profiler.stats()
+        self.assertEqual(stats['Adder.Double']['calls'], 3)
+        self.assertEqual(stats['Adder.Double']['hits'], 1)
+        self.assertEqual(stats['Adder.Double']['computes'], 2)
+        lazy = graph._graph.invalidation == graph.Graph.LAZY
+        # Verifying Double reads Sum again under LAZY.
+        self.assertEqual(stats['Adder.Sum']['calls'], 3 if lazy else 2)
+        self.assertEqual(stats['Adder.Sum']['computes'], 2)
+        self.assertEqual(stats['Adder.Double']['invalidations'], 0 if lazy else 1)
+        for s in stats.values():
+            self.assertEqual(s['calls'], s['hits'] + s['computes'])
+        self.assertTrue(stats['Adder.Double']['selfTime'] <= stats['Adder.Double']['time'])
+        names = [line.split()[0] for line in profiler.report(sortBy='calls').splitlines()[1:]]
+        self.assertEqual(names, sorted(stats, key=lambda name: (-stats[name]['calls'], name)))
+        self.assertEqual(len(profiler.report(top=2).splitlines()), 3)
+        self.assertEqual(json.loads(profiler.dump()), stats)
+
+    def test_batch(self):
+        obj = Adder()
+        notified = []
+        obj.Double.subscribe(lambda descriptor: notified.append(descriptor.name))
+        obj.Double()
+        with graph.batch():
+            obj.A.setValue(5)
+            with graph.batch():
+                obj.B.setValue(6)
+            obj.A.setValue(7)
+            self.assertEqual(notified, [])
+        self.assertEqual(notified, ['Double'])
+        self.assertEqual(obj.Double(), 26)
+        with graph.batch():
+            obj.A.setValue(1)
+            self.assertEqual(obj.Double(), 14)
+            obj.B.setValue(2)
+        self.assertEqual(obj.Double(), 6)
+        self.assertEqual(notified, ['Double', 'Double'])
+
+    def test_rollback(self):
+        g = graph._graph
+        obj = Adder()
+        obj.A.setValue(10)
+        self.assertEqual(obj.Double(), 24)
+        checkpoint = g.checkpoint()
+        obj.A.setValue(20)
+        obj.B.setValue(5)
+        self.assertEqual(obj.Double(), 50)
+        later = g.checkpoint()
+        created = Adder()
+        g._nodeSetData(created.A.node(), 7)
+        created.A.setValue(8)
+        g.rollback(checkpoint)
+        self.assertEqual(obj.Double(), 24)
+        self.assertFalse(obj.B.node().fixed())
+        self.assertEqual(created.A(), 7)
+        self.assertEqual(len(checkpoint), 1)
+        g.rollback(later)
+        self.assertEqual(obj.Double(), 50)
+        self.assertRaises(RuntimeError, graph.Graph().rollback, later)
+
+    def test_unhashable_args(self):
+        obj = Lookup()
+        calls = Lookup.calls
+        self.assertEqual(obj.Resolve({'a': [2, 3], 'b': 4}, ['a', 'c']), [[2, 3], 1])
+        self.assertEqual(obj.Resolve({'b': 4, 'a': [2, 3]}, ['a', 'c']), [[2, 3], 1])
+        self.assertEqual(Lookup.calls, calls + 1)
+        self.assertEqual(obj.Resolve({'a': [2, 3]}, ('a', 'c')), [[2, 3], 1])
+        self.assertEqual(obj.Resolve({'a': (2, 3)}, ['a', 'c']), [(2, 3), 1])
+        self.assertEqual(Lookup.calls, calls + 3)
+        obj.Base.setValue(0)
+        self.assertEqual(obj.Resolve({'a': [2, 3], 'b': 4}, ['c']), [0])
+        self.assertRaises(TypeError, obj.Resolve, {'a': bytearray()}, ['a'])
+
+    def test_memory_budget(self):
+        graph._graph.setMemoryBudget(2, sizeOf=lambda value: 1)
+        obj = Adder()
+        self.assertEqual(obj.Double(), 6)
+        self.assertEqual(graph._graph.memoryBudget.size, 2)
+        self.assertEqual(graph._graph.stats()['evictions'], 2)
+        self.assertTrue(obj.Double.node().valid())
+        self.assertEqual(list(obj.Sum.node().outputs), [obj.Double.node()])
+        obj.A.setValue(2)
+        self.assertEqual(obj.Double(), 8)
+        self.assertTrue(graph._graph.memoryBudget.size <= 2)
+
+class ArrayAdjacencyValueTestCase(ValueTestCase):
+
+    graphKwargs = {'adjacencyClass': graph.GraphArrayAdjacency}
+
+class LazyValueTestCase(ValueTestCase):
+
+    graphKwargs = {'invalidation': graph.Graph.LAZY}
+
+    def test_set_invalidates(self):
+        obj = Adder()
+        self.assertEqual(obj.Double(), 6)
+        revision = graph._graph.revision
+        obj.A.setValue(10)
+        self.assertEqual(graph._graph.revision, revision + 1)
+        self.assertTrue(obj.Sum.node().valid())
+        self.assertEqual(obj.Double(), 24)
+        obj.A.clearValue()
+        self.assertEqual(obj.Double(), 6)
+        self.assertEqual(Adder.calls, 3)
+
+    def test_verify(self):
+        obj = Adder()
+        other = Adder()
+        self.assertEqual(obj.Double(), 6)
+        self.assertEqual(other.Double(), 6)
+        other.A.setValue(10)
+        self.assertEqual(obj.Double(), 6)
+        self.assertEqual(Adder.calls, 2)
+        nodeData = graph._graph.nodeData(obj.Double.node())
+        self.assertEqual(nodeData.verifiedAt, graph._graph.revision)
+        self.assertTrue(nodeData.changedAt < graph._graph.revision)
+
+    def test_scenario(self):
+        obj = Adder()
+        self.assertEqual(obj.Double(), 6)
+        with graph.scenario():
+            obj.A.setWhatIf(10)
+            self.assertEqual(obj.Double(), 24)
+            obj.B.setValue(3)
+            self.assertEqual(obj.Double(), 26)
+        self.assertEqual(obj.Double(), 8)
+
+class EarlyCutoffTestCase(GraphTestCase):
+
+    graphKwargs = {'earlyCutoff': True}
+
+    def test_cutoff(self):
+        obj = Parity()
+        self.assertEqual(obj.Label(), 'odd')
+        obj.Items.setValue([1, 2, 3])
+        self.assertFalse(obj.Label.node().valid())
+        self.assertEqual(obj.Label(), 'odd')
+        self.assertEqual(Parity.calls, 1)
+        obj.Items.setValue([1, 2])
+        self.assertEqual(obj.Label(), 'even')
+        self.assertEqual(Parity.calls, 2)
+
+    def test_fingerprint(self):
+        obj = Parity()
+        self.assertEqual(obj.CopyLength(), 1)
+        obj.Items.setValue([2])
+        self.assertEqual(obj.CopyLength(), 1)
+        self.assertEqual(Parity.calls, 1)
+        self.assertEqual(obj.Copy(), [2])
+
+    def test_eviction(self):
+        graph._graph.setMemoryBudget(0, sizeOf=lambda value: 1)
+        obj = Parity()
+        self.assertEqual(obj.Label(), 'odd')
+        obj.Items.setValue([1, 2])
+        self.assertEqual(obj.Label(), 'even')
+
+    def test_cleared_what_if(self):
+        obj = Adder()
+        self.assertEqual(obj.Sum(), 3)
+        with graph.scenario():
+            obj.A.setWhatIf(10)
+            self.assertEqual(obj.Sum(), 12)
+            obj.A.clearWhatIf()
+            self.assertEqual(obj.Sum(), 3)
+
+class LazyEarlyCutoffTestCase(EarlyCutoffTestCase):
+
+    graphKwargs = {'earlyCutoff': True, 'invalidation': graph.Graph.LAZY}
+
+    def test_cutoff(self):
+        obj = Parity()
+        self.assertEqual(obj.Label(), 'odd')
+        obj.Items.setValue([1, 2, 3])
+        self.assertEqual(obj.Label(), 'odd')
+        self.assertEqual(Parity.calls, 1)
+        obj.Items.setValue([1, 2])
+        self.assertEqual(obj.Label(), 'even')
+        self.assertEqual(Parity.calls, 2)
+
+class ScenarioTestCase(GraphTestCase):
+
+    def test_what_if(self):
+        obj = Adder()
+        self.assertEqual(obj.Double(), 6)
+        with graph.scenario() as s:
+            obj.A.setWhatIf(10)
+            self.assertEqual(obj.Double(), 24)
+        self.assertEqual(obj.Double(), 6)
+
+    def test_nested(self):
+        obj = Adder()
+        self.assertEqual(obj.Double(), 6)
+        with graph.scenario():
+            obj.A.setWhatIf(10)
+            with graph.scenario():
+                obj.B.setWhatIf(20)
+                with graph.scenario():
+                    self.assertEqual(obj.Double(), 60)
+                self.assertEqual(obj.Double(), 60)
+            self.assertEqual(obj.Double(), 24)
+        self.assertEqual(obj.Double(), 6)
+
+    def test_cleared_under_kept(self):
+        obj = Adder()
+        self.assertEqual(obj.Sum(), 3)
+        with graph.scenario():
+            obj.A.setWhatIf(10)
+            kept = graph.scenario()
+            with kept:
+                self.assertEqual(obj.Sum(), 12)
+            obj.A.clearWhatIf()
+            with kept:
+                self.assertEqual(obj.Sum(), 3)
+
+    def test_parent_changed_while_nested(self):
+        obj = Adder()
+        self.assertEqual(obj.A(), 1)
+        with graph.scenario() as outer:
+            with graph.scenario():
+                graph._graph.nodeSetWhatIf(obj.A.node(), 10, dataStore=outer)
+                self.assertEqual(obj.A(), 10)
+                graph._graph.nodeClearWhatIf(obj.A.node(), dataStore=outer)
+                self.assertEqual(obj.A(), 1)
+
+    def test_reenter(self):
+        obj = Adder()
+        s = graph.scenario()
+        with s:
+            obj.A.setWhatIf(10)
+            self.assertEqual(obj.Double(), 24)
+        calls = Adder.calls
+        self.assertEqual(obj.Double(), 6)
+        with s:
+            self.assertEqual(obj.Double(), 24)
+        self.assertEqual(Adder.calls, calls + 1)      # Just outside.
+
+    def test_reenter_after_change(self):
+        obj = Adder()
+        s = graph.scenario()
+        with s:
+            obj.A.setWhatIf(10)
+            self.assertEqual(obj.Double(), 24)
+        obj.B.setValue(5)
+        calls = Adder.calls
+        with s:
+            self.assertEqual(obj.Double(), 30)
+            self.assertEqual(Adder.calls, calls + 1)
+        obj.A.setValue(3)
+        with s:
+            self.assertEqual(obj.Double(), 30)
+        self.assertEqual(Adder.calls, calls + 1)      # Still overridden.
+
+    def test_reenter_elsewhere(self):
+        obj = Adder()
+        s = graph.scenario()
+        with s:
+            obj.A.setWhatIf(10)
+            self.assertEqual(obj.Double(), 24)
+        with graph.scenario():
+            obj.B.setWhatIf(7)
+            with s:
+                self.assertEqual(obj.Double(), 34)
+        with s:
+            self.assertEqual(obj.Double(), 24)
+
+    def test_diff(self):
+        obj, other = Adder(), Adder()
+        self.assertEqual(obj.Double(), 6)
+        s = graph.scenario()
+        with s:
+            obj.A.setWhatIf(10)
+            other.B.setWhatIf(2)
+        diff = s.diff()
+        self.assertEqual(diff, {obj.A.node(): (1, 10), obj.Sum.node(): (3, 12), obj.Double.node(): (6, 24)})
+        self.assertEqual(s.diff(fields=['Double']), {obj.Double.node(): (6, 24)})
+        self.assertEqual(s.diff(fields=[obj.Sum]), {obj.Sum.node(): (3, 12)})
+        with s:
+            self.assertEqual(len(s.diff()), 3)
+            self.assertRaises(RuntimeError, s.diff, graph.scenario())
+
+    def test_diff_new_edges(self):
+        obj = Adder()
+        s = graph.scenario()
+        with s:
+            obj.A.setWhatIf(2)
+            with graph.scenario():
+                self.assertEqual(obj.Sum(), 4)
+            self.assertEqual(s.diff(), {obj.A.node(): (1, 2), obj.Sum.node(): (3, 4)})
+            self.assertEqual(obj.Sum(), 4)
+        self.assertEqual(obj.Sum(), 3)
+
+class LazyScenarioTestCase(ScenarioTestCase):
+
+    graphKwargs = {'invalidation': graph.Graph.LAZY}
+
+class SweepTestCase(GraphTestCase):
+
+    def test_sweep(self):
+        obj = Adder()
+        self.assertEqual(obj.Double(), 6)
+        calls = Adder.calls
+        self.assertEqual(graph.sweep(obj.Double, obj.A, range(5)), [4, 6, 8, 10, 12])
+        self.assertEqual(Adder.calls, calls + 5)
+        self.assertEqual(obj.Double(), 6)
+        self.assertEqual(Adder.calls, calls + 5)
+
+    def test_branch(self):
+        obj = Branch()
+        self.assertEqual(obj.Scaled(), 0)
+        self.assertEqual(obj.Result(), -1)
+        self.assertEqual(graph.sweep(obj.Result, obj.X, [0, 1, 2, 0]), [-1, 10, 20, -1])
+
+    def test_new_branch(self):
+        obj = Threshold()
+        self.assertEqual(graph.sweep(obj.T, obj.W, [10, 20, 30]), [30, 60, 90])
+        self.assertEqual(graph.sweep(obj.T, obj.W, [2, 10, 3, 20]), [2, 30, 3, 60])
+        self.assertEqual(obj.T(), 1)
+
+    def test_processes(self):
+        obj = Adder()
+        self.assertEqual(graph.sweep(obj.Double, obj.A, range(7), workers=3), [4, 6, 8, 10, 12, 14, 16])
+
+    def test_processes_threads(self):
+        objs = [Adder(), Adder()]
+        objs[1].B.setValue(10)
+        results = [None, None]
+        def run(i):
+            results[i] = graph.sweep(objs[i].Double, objs[i].A, range(20), workers=2)
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [[2 * (a + 2) for a in range(20)],
+                                   [2 * (a + 10) for a in range(20)]])
+
+class LazySweepTestCase(SweepTestCase):
+
+    graphKwargs = {'invalidation': graph.Graph.LAZY}
+
+class IterativeTestCase(GraphTestCase):
+
+    graphKwargs = {'maxDepth': 50}
+
+    def test_deep_chain(self):
+        obj = Chain()
+        self.assertEqual(obj.Link(20000), 20000)
+        obj.Base.setValue(5)
+        self.assertEqual(obj.Link(20000), 20005)
+        self.assertEqual(list(obj.Link.node(args=(20000,)).inputs), [obj.Link.node(args=(19999,))])
+
+    def test_recursion_limit(self):
+        graph._graph = graph.Graph()
+        obj = Chain()
+        self.assertRaises(RuntimeError, obj.Link, 20000)        # RecursionError
+
+class LazyIterativeTestCase(IterativeTestCase):
+
+    graphKwargs = {'maxDepth': 50, 'invalidation': graph.Graph.LAZY}
+
+class ReactiveTestCase(GraphTestCase):
+
+    graphKwargs = {'reactive': True}
+
+    def test_push(self):
+        obj = Adder()
+        seen = []
+        def notify(descriptor):
+            seen.append((descriptor.name, subscriptions[descriptor.name].value, obj.Double(), Adder.calls))
+        subscriptions = dict((f.name, f.subscribe(notify)) for f in (obj.Sum, obj.Double))
+        obj.Double()
+        obj.A.setValue(5)
+        # Both were current before either subscriber was told.
+        self.assertEqual(sorted(seen), [('Double', 14, 14, 2), ('Sum', 7, 14, 2)])
+        del seen[:]
+        with graph.batch():
+            obj.A.setValue(1)
+            obj.B.setValue(1)
+        self.assertEqual(sorted(seen), [('Double', 4, 4, 3), ('Sum', 2, 4, 3)])
+
+    def test_push_from_scenario(self):
+        g = graph._graph
+        obj = Adder()
+        subscription = obj.Sum.subscribe(lambda descriptor: None)
+        self.assertEqual(obj.Sum(), 3)
+        with graph.scenario():
+            obj.A.setWhatIf(100)
+            self.assertEqual(obj.Sum(), 102)
+            g.nodeSetValue(obj.A.node(), 2, g.rootDataStore)
+            self.assertEqual(subscription.value, 4)
+        calls = Adder.calls
+        self.assertTrue(obj.Sum.node().valid())
+        self.assertEqual(obj.Sum(), 4)
+        self.assertEqual(Adder.calls, calls)
+
+class LazyReactiveTestCase(ReactiveTestCase):
+
+    graphKwargs = {'reactive': True, 'invalidation': graph.Graph.LAZY}
+
+class ThreadTestCase(GraphTestCase):
+
+    def test_computed_once(self):
+        obj = Gate()
+        threads, results = run(*[obj.Slow] * 4)
+        obj.entered.wait(5)
+        obj.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [1] * 4)
+        self.assertEqual(Gate.calls, 1)
+
+    def test_disjoint(self):
+        a, b = Gate(), Gate()
+        threads, results = run(a.Slow, b.Slow)
+        # Each waits for the other to start, so both must run at once.
+        self.assertTrue(a.entered.wait(5) and b.entered.wait(5))
+        a.release.set()
+        b.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [1, 1])
+
+    def test_write_while_computing(self):
+        obj = Gate()
+        threads, results = run(obj.Slow)
+        obj.entered.wait(5)
+        obj.A.setValue(2)
+        obj.release.set()
+        threads[0].join()
+        self.assertEqual(results, [1])
+        self.assertFalse(obj.Slow.node().valid())
+        self.assertEqual(obj.Slow(), 2)
+
+    def test_context(self):
+        obj = Adder()
+        with graph.scenario():
+            obj.A.setWhatIf(10)
+            threads, results = run(obj.A, lambda: graph._graph.activeDataStore)
+            for thread in threads:
+                thread.join()
+            self.assertEqual(obj.A(), 10)
+        self.assertEqual(results, [1, graph._graph.rootDataStore])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""Unit tests for the static analysis of graph methods."""
+
+import unittest
+
+import broom.graph.graph as graph
+from broom.graph.parser import BroomArgRef, BroomParser
+
+def field(f, flags=graph.NodeDescriptor.READONLY):
+    return graph.NodeDescriptor(f, flags, f.__name__)
+
+class Pair(object):
+
+    def __init__(self):
+        for k in ('A', 'B', 'Scaled', 'Sum', 'Choose'):
+            setattr(self, k, graph.NodeDescriptorBound(self, getattr(self.__class__, k)))
+
+    def A(self):
+        return 1
+    A = field(A, graph.NodeDescriptor.SETTABLE)
+
+    def B(self):
+        return 2
+    B = field(B, graph.NodeDescriptor.SETTABLE)
+
+    def Scaled(self, factor):
+        return self.A() * factor
+    Scaled = field(Scaled)
+
+    def Sum(self):
+        return self.Scaled(10) + self.B()
+    Sum = field(Sum)
+
+    def Choose(self):
+        return self.Sum() if self.A() else self.B()
+    Choose = field(Choose)
+
+def parse(s):
+    dependencies = BroomParser(set(['A', 'B', 'C'])).parse_s(s)
+    return [(i.name, tuple('arg%d' % a.index if isinstance(a, BroomArgRef) else a for a in i.args), i.conditional)
+            for i in dependencies.inputs], dependencies.complete
+
+class ParserTestCase(unittest.TestCase):
+
+    def test_inputs(self):
+        self.assertEqual(parse('''
+def X(self, x, y):
+    z = self.A() + self.A()
+    return self.B(x, 'b', -1) * self.C(y) + z
+'''), ([('A', (), False), ('B', ('arg0', 'b', -1), False), ('C', ('arg1',), False)], True))
+
+    def test_conditional(self):
+        self.assertEqual(parse('''
+def X(self):
+    if self.A():
+        return self.B()
+    return self.C() or [self.A(i) for i in range(2)]
+'''), ([('A', (), False), ('B', (), True), ('C', (), True)], False))
+
+    def test_dynamic(self):
+        self.assertEqual(parse('''
+def X(self, x):
+    x = x + 1
+    return self.A(x) + self.width
+'''), ([], False))
+        self.assertEqual(parse('''
+def X(self):
+    return helper(self, self.B)
+'''), ([], False))
+
+    def test_unparseable(self):
+        self.assertEqual(BroomParser().parse(len), None)
+
+class StaticInputsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._savedGraph = graph._graph
+        graph._graph = graph.Graph()
+
+    def tearDown(self):
+        graph._graph = self._savedGraph
+
+    def test_nodes(self):
+        obj = Pair()
+        g = graph._graph
+        self.assertEqual(g.nodeStaticInputs(obj.Sum.node()), [obj.Scaled.node(args=(10,)), obj.B.node()])
+        self.assertEqual(g.nodeStaticInputs(obj.Scaled.node(args=(3,))), [obj.A.node()])
+        self.assertEqual(g.nodeStaticInputs(obj.Choose.node(), conditional=False), [obj.A.node()])
+
+    def test_edges(self):
+        obj = Pair()
+        self.assertEqual(graph._graph.nodeBuildEdges(obj.Choose.node()), 3)
+        self.assertEqual(list(obj.A.node().outputs), [obj.Choose.node(), obj.Scaled.node(args=(10,))])
+        s = graph.scenario()
+        with s:
+            obj.B.setWhatIf(5)
+        # Found from the edges, though nothing has been evaluated.
+        self.assertEqual(s.diff(fields=['Sum', 'Choose']), {obj.Sum.node(): (12, 15), obj.Choose.node(): (12, 15)})
+
+if __name__ == '__main__':
+    unittest.main()
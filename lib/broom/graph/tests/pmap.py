@@ -0,0 +1,63 @@
+"""Unit tests for the persistent map."""
+
+import unittest
+
+from broom.graph.pmap import EMPTY
+
+class Key(object):
+    """A key with a chosen hash, to force collisions."""
+
+    def __init__(self, name, hash):
+        self.name = name
+        self.hash = hash
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        return isinstance(other, Key) and other.name == self.name
+
+class PersistentMapTestCase(unittest.TestCase):
+
+    def test_set(self):
+        m = EMPTY
+        for i in range(1000):
+            m = m.set(i, i * 2)
+        self.assertEqual(len(m), 1000)
+        self.assertEqual(m.get(999), 1998)
+        self.assertEqual(m.get(1000), None)
+        self.assertEqual(len(m.set(5, 0)), 1000)
+        self.assertEqual(m.set(5, 0).get(5), 0)
+        self.assertEqual(m.get(5), 10)
+
+    def test_discard(self):
+        m = EMPTY.update((i, i) for i in range(100))
+        n = m
+        for i in range(0, 100, 2):
+            n = n.discard(i)
+        self.assertEqual(sorted(n), list(range(1, 100, 2)))
+        self.assertEqual(len(m), 100)
+        self.assertTrue(n.discard(0) is n)
+
+    def test_collisions(self):
+        keys = [Key(i, i % 3) for i in range(12)] + [Key('x', -1), Key('y', -1 + 2**64)]
+        m = EMPTY.update((key, key.name) for key in keys)
+        for key in keys:
+            self.assertEqual(m.get(key), key.name)
+        for key in keys[::2]:
+            m = m.discard(key)
+        self.assertEqual(len(m), len(keys) // 2)
+        for i, key in enumerate(keys):
+            self.assertEqual(m.get(key), None if i % 2 == 0 else key.name)
+
+    def test_diff(self):
+        keys = list(range(500)) + [Key('x', 7), Key('y', 7)]
+        m = EMPTY.update((key, [key]) for key in keys)
+        n = m.discard(3).discard(Key('x', 7)).set(4, 'four').set(1000, 'new')
+        self.assertEqual(sorted(((key, value) for key, value, other in n.diff(m)), key=repr),
+                         sorted([(3, None), (4, 'four'), (1000, 'new'), (Key('x', 7), None)], key=repr))
+        self.assertEqual(list(m.diff(m)), [])
+        self.assertEqual(dict((key, other) for key, value, other in EMPTY.diff(n))[4], 'four')
+
+if __name__ == '__main__':
+    unittest.main()
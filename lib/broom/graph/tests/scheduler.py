@@ -0,0 +1,132 @@
+"""Unit tests for the parallel schedulers."""
+
+import threading
+import unittest
+
+import broom.graph.graph as graph
+from broom.graph.scheduler import GraphProcessScheduler, GraphScheduler, futures
+
+def field(f, flags=graph.NodeDescriptor.READONLY):
+    return graph.NodeDescriptor(f, flags, f.__name__)
+
+class Fan(object):
+    """A Total over Leaf(0) .. Leaf(width - 1), each reading Source."""
+    calls = 0
+
+    def __init__(self, width=4):
+        self.width = width
+        self.started = [threading.Event() for i in range(width)]
+        for k in ('Source', 'Leaf', 'Total'):
+            setattr(self, k, graph.NodeDescriptorBound(self, getattr(self.__class__, k)))
+
+    def Source(self):
+        return 1
+    Source = field(Source, graph.NodeDescriptor.SETTABLE)
+
+    def Leaf(self, i):
+        Fan.calls += 1
+        return self.Source() * i
+    Leaf = field(Leaf)
+
+    def Total(self):
+        return sum(self.Leaf(i) for i in range(self.width))
+    Total = field(Total)
+
+class Rendezvous(Fan):
+    """Leaves that wait for each other, so finish only in parallel."""
+
+    def Leaf(self, i):
+        source = self.Source()
+        if source:
+            self.started[i].set()
+            if not all(started.wait(5) for started in self.started):
+                return None
+        return source * i
+    Leaf = field(Leaf)
+
+class StaticRendezvous(Rendezvous):
+    """Leaves read by literal arguments, so known before evaluation."""
+
+    def Total(self):
+        return self.Leaf(0) + self.Leaf(1) + self.Leaf(2) + self.Leaf(3)
+    Total = field(Total)
+
+class InlineFuture(object):
+
+    def __init__(self, f, args):
+        self._value = f(*args)
+
+    def result(self):
+        return self._value
+
+    def add_done_callback(self, callback):
+        callback(self)
+
+    def cancel(self):
+        return False
+
+class InlineExecutor(object):
+    """Runs each task as it is submitted; needs no concurrent.futures."""
+
+    def submit(self, f, *args):
+        return InlineFuture(f, args)
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._savedGraph = graph._graph
+        graph._graph = graph.Graph()
+        Fan.calls = 0
+
+    def tearDown(self):
+        graph._graph = self._savedGraph
+
+    @unittest.skipIf(futures is None, "No thread pool without concurrent.futures.")
+    def test_threads(self):
+        obj = Rendezvous()
+        obj.Source.setValue(0)
+        self.assertEqual(obj.Total(), 0)
+        obj.Source.setValue(1)
+        with GraphScheduler(graph._graph, workers=obj.width) as scheduler:
+            self.assertEqual(scheduler.nodeValue(obj.Total.node()), 6)
+        self.assertTrue(obj.Total.node().valid())
+
+    @unittest.skipIf(futures is None, "No thread pool without concurrent.futures.")
+    def test_static_plan(self):
+        obj = StaticRendezvous()
+        with GraphScheduler(graph._graph, workers=obj.width) as scheduler:
+            self.assertEqual(scheduler.nodeValue(obj.Total.node()), 6)
+
+    @unittest.skipIf(futures is None, "No thread pool without concurrent.futures.")
+    def test_records_inputs(self):
+        obj = Fan()
+        self.assertEqual(obj.Total(), 6)
+        obj.Source.setValue(2)
+        node = obj.Total.node()
+        with GraphScheduler(graph._graph, workers=2) as scheduler:
+            self.assertEqual(scheduler.nodeValues([node, obj.Leaf.node(args=(3,))]), [12, 6])
+        self.assertEqual(len(list(node.inputs)), obj.width)
+
+    def test_executor(self):
+        obj = Fan()
+        self.assertEqual(obj.Total(), 6)
+        obj.Source.setValue(2)
+        scheduler = GraphScheduler(graph._graph, executor=InlineExecutor())
+        self.assertEqual(scheduler.nodeValue(obj.Total.node()), 12)
+        self.assertTrue(obj.Leaf.node(args=(3,)).valid())
+
+    def test_processes(self):
+        obj = Fan()
+        self.assertEqual(obj.Total(), 6)
+        obj.Source.setValue(2)
+        calls = Fan.calls
+        scheduler = GraphProcessScheduler(graph._graph, workers=2)
+        self.assertEqual(scheduler.nodeValue(obj.Total.node()), 12)
+        self.assertEqual(Fan.calls, calls)          # Computed in the workers.
+        self.assertTrue(obj.Leaf.node(args=(3,)).valid())
+        self.assertEqual(list(obj.Leaf.node(args=(3,)).outputs), [obj.Total.node()])
+        obj.Source.setValue(3)
+        self.assertEqual(obj.Total(), 18)
+
+if __name__ == '__main__':
+    unittest.main()
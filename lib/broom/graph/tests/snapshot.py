@@ -0,0 +1,112 @@
+"""Unit tests for graph snapshots."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import broom.graph.graph as graph
+from broom.graph.snapshot import GraphSnapshot
+
+def field(f, flags=graph.NodeDescriptor.READONLY):
+    return graph.NodeDescriptor(f, flags | graph.NodeDescriptor.SERIALIZABLE, f.__name__)
+
+class Account(object):
+    """An object known to snapshots by name, through registry."""
+    registry = {}
+    calls = 0
+
+    def __init__(self, name):
+        self.name = name
+        Account.registry[name] = self
+        for k in ('Balance', 'Rate', 'Interest', 'Self'):
+            setattr(self, k, graph.NodeDescriptorBound(self, getattr(self.__class__, k)))
+
+    def snapshotIdentity(self):
+        return self.name
+
+    def Balance(self):
+        return 100
+    Balance = field(Balance, graph.NodeDescriptor.SETTABLE)
+
+    def Rate(self):
+        return 2
+    Rate = field(Rate, graph.NodeDescriptor.SETTABLE)
+
+    def Interest(self):
+        Account.calls += 1
+        return self.Balance() * self.Rate()
+    Interest = field(Interest)
+
+    def Self(self):
+        return [self, self.Interest()]
+    Self = field(Self)
+
+class SnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._savedGraph = graph._graph
+        self._dir = tempfile.mkdtemp()
+        self.path = os.path.join(self._dir, 'graph.snapshot')
+        Account.registry = {}
+        Account.calls = 0
+
+    def tearDown(self):
+        graph._graph = self._savedGraph
+        shutil.rmtree(self._dir)
+
+    def save(self, setup):
+        graph._graph = graph.Graph()
+        obj = setup(Account('a'))
+        obj.Self()
+        return GraphSnapshot(graph._graph).save(self.path)
+
+    def start(self):
+        """Starts a new graph, as if in a new process, warmed up from
+        the snapshot.
+
+        """
+        Account.registry = {}
+        graph._graph = graph.Graph()
+        snapshot = GraphSnapshot(graph._graph, resolve=Account.registry.get)
+        snapshot.load(self.path)
+        graph._graph.setSnapshot(snapshot)
+        return snapshot
+
+    def setBalance(self, obj, value=300):
+        obj.Balance.setValue(value)
+        return obj
+
+    def test_restore(self):
+        self.assertEqual(self.save(self.setBalance), 3)       # Rate, Interest, Self.
+        snapshot = self.start()
+        obj = self.setBalance(Account('a'))
+        calls = Account.calls
+        self.assertEqual(obj.Interest(), 600)
+        self.assertEqual(Account.calls, calls)
+        self.assertEqual(snapshot.restored, 2)           # Interest and Rate.
+        self.assertEqual(set(obj.Interest.node().inputs), set([obj.Balance.node(), obj.Rate.node()]))
+        obj.Rate.setValue(3)
+        self.assertEqual(obj.Interest(), 900)
+        self.assertEqual(Account.calls, calls + 1)
+
+    def test_changed_input(self):
+        self.save(self.setBalance)
+        snapshot = self.start()
+        obj = self.setBalance(Account('a'), 400)
+        calls = Account.calls
+        self.assertEqual(obj.Interest(), 800)
+        self.assertEqual(Account.calls, calls + 1)
+        self.assertEqual(snapshot.restored, 1)           # Just Rate.
+
+    def test_references(self):
+        self.save(self.setBalance)
+        snapshot = self.start()
+        obj = self.setBalance(Account('a'))
+        value = obj.Self()
+        self.assertTrue(value[0] is obj)
+        self.assertEqual(value[1], 600)
+        self.assertEqual(snapshot.restored, 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,7 +26,7 @@ class GraphVisitor(object):
             self.visitNode(currentNode)
             if currentNode.fixed() or not currentNode.valid():
                 continue
-            nodes.append(currentNode.inputs)
+            nodes.extend(currentNode.inputs)
 
 class GraphDepthFirstVisitor(GraphVisitor):
     """A depth-first graph visitor"""
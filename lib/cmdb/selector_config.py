@@ -37,17 +37,29 @@ class SelectorConfigSet(broom.BroomObject):
     def SelectorSet(self):
         return broom.types.SelectorSet(SelectorObjects=self.SelectorObjects())
 
-    # TODO: Put on the graph after handling non-hashable args.
     # TODO: Rename this to reflect service_instantiation as 'config'.
     def objectConfigs(self, objs):
-        return [(obj, self.objectConfig(obj)) for obj in objs]
+        return [(obj, _copyConfig(config)) for obj, config in self._objectConfigs(objs)]
 
-    # TODO: Put on the graph after handling non-hashable args.
     # TODO: Rename this to reflect service_instantiation as 'config'.
     def objectConfig(self, obj):
-        """Returns the resolved configuration for the object.
+        """Returns the resolved configuration for the object, as a
+        copy the caller is free to change.
 
         """
+        return _copyConfig(self._objectConfig(obj))
+
+    # The cached configs below are shared by every caller, so they
+    # are only ever handed out as copies.  Note that the objects
+    # they are keyed by are held by the graph for as long as the
+    # nodes are.
+
+    @broom.field
+    def _objectConfigs(self, objs):
+        return tuple((obj, self._objectConfig(obj)) for obj in objs)
+
+    @broom.field
+    def _objectConfig(self, obj):
         attractions = self.SelectorSet().evaluateOne(obj)
         selectors = {}
         for a in attractions:
@@ -71,3 +83,6 @@ class SelectorConfigSet(broom.BroomObject):
                             = d.ServiceInstantiation()
             ds.update(t)
         return ds
+
+def _copyConfig(config):
+    return dict((service, dict(roles)) for service, roles in config.items())
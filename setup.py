@@ -8,6 +8,7 @@ setup(name         = 'broom',
       package_dir  = {'': 'lib'},
       packages     = [
           'broom',
+          'broom.benchmark',
           'broom.client',
           'broom.ext',
           'broom.ext.google',